@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Memory held by the combined feed on a large synthetic set of PubMed feeds.
+
+Compares keeping the full feedparser items with keeping Article records,
+and checks that both give the same publications to post.
+
+    python benchmarks/bench_feed_memory.py [number of feeds] [entries per feed]
+"""
+import gc
+import os
+import random
+import sys
+import time
+import tracemalloc
+from email.utils import formatdate
+
+import feedparser
+
+# run from the checkout, not from an installed copy of scibot
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scibot.articles import ArticleCache, Article
+
+WORDS = (
+    "psilocybin therapy patients placebo MDMA effects ketamine depression "
+    "anxiety trial cohort p &lt; 0.05 95% CI (n = 120) &amp; receptor "
+    "serotonin outcomes participants harm reduction policy"
+).split()
+
+
+def make_feed(index: int, size: int, rng: random.Random) -> str:
+    """synthetic PubMed RSS feed, entries newest first"""
+    items = []
+    now = time.time()
+    for i in range(size):
+        pmid = index * 1000000 + i
+        abstract = " ".join(rng.choice(WORDS) for _ in range(rng.randint(150, 300)))
+        doi = f"10.1177/{pmid}"
+        body = (
+            f"<p>J Psychopharmacol. 2021. doi: {doi}.</p>"
+            f"<p><b>ABSTRACT</b></p><p><b>BACKGROUND:</b> {abstract}</p>"
+            f'<p>PMID:<a href="https://pubmed.ncbi.nlm.nih.gov/{pmid}/">{pmid}</a> | '
+            f'DOI:<a href="https://doi.org/{doi}">{doi}</a></p>'
+        )
+        authors = "".join(
+            f"<dc:creator>Author {rng.randint(1, 999)}</dc:creator>"
+            for _ in range(rng.randint(1, 8))
+        )
+        items.append(
+            f"<item><title>Study {pmid} of {rng.choice(WORDS)}</title>"
+            f"<link>https://pubmed.ncbi.nlm.nih.gov/{pmid}/</link>"
+            f"<description><![CDATA[{body}]]></description>"
+            f"<content:encoded><![CDATA[{body}]]></content:encoded>"
+            f"{authors}<pubDate>{formatdate(now - i * 3600 - index)}</pubDate>"
+            f'<guid isPermaLink="false">pubmed:{pmid}</guid></item>'
+        )
+    return (
+        '<?xml version="1.0"?><rss version="2.0" '
+        'xmlns:content="http://purl.org/rss/1.0/modules/content/" '
+        'xmlns:dc="http://purl.org/dc/elements/1.1/"><channel>'
+        f"<title>PubMed {index}</title>{''.join(items)}</channel></rss>"
+    )
+
+
+def retained(build):
+    """memory still allocated after build() returns, and its result"""
+    gc.collect()
+    tracemalloc.start()
+    result = build()
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return size, result
+
+
+def main():
+    feeds = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    size = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    rng = random.Random(42)
+    documents = [make_feed(index, size, rng) for index in range(feeds)]
+
+    items_size, items = retained(
+        lambda: [x for doc in documents for x in feedparser.parse(doc).entries]
+    )
+    cache = ArticleCache(feeds * size)
+    articles_size, articles = retained(
+        lambda: [
+            article
+            for doc in documents
+            for article in map(cache.get, feedparser.parse(doc).entries)
+            if article is not None
+        ]
+    )
+
+    assert len(items) == len(articles)
+    assert all(
+        x.id == y.id and Article.from_entry(x)["abstract"] == y.abstract
+        for x, y in zip(items, articles)
+    ), "Article records disagree with the feed items"
+
+    count = len(items)
+    print(f"entries:  {count}")
+    print(f"items:    {items_size / 2 ** 20:.1f} MiB  {items_size / count:,.0f} B/entry")
+    print(f"articles: {articles_size / 2 ** 20:.1f} MiB  {articles_size / count:,.0f} B/entry")
+    print(f"saving:   {items_size / articles_size:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Speed of ordering the combined feed on a large synthetic set of feed items.
+
+Compares the former dateutil parse and full sort with the parsed dates and
+k-way merge of combine_feeds, and checks that both give the same order.
+
+    python benchmarks/bench_feed_sort.py [number of feeds] [entries per feed]
+"""
+import os
+import random
+import sys
+import time
+from email.utils import formatdate
+
+import dateutil.parser
+import feedparser
+
+# run from the checkout, not from an installed copy of scibot
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scibot.articles import Article, published_time
+from scibot.feeds import combine_feeds
+
+
+def make_feeds(feeds: int, size: int, seed: int = 42) -> list:
+    """synthetic RSS feeds, items newest first with dates in several time zones"""
+    rng = random.Random(seed)
+    now = time.time()
+    documents = []
+    for index in range(feeds):
+        stamps = sorted((now - rng.randint(0, 90 * 86400) for _ in range(size)), reverse=True)
+        items = "".join(
+            f"<item><title>Study {index}-{i}</title>"
+            f"<pubDate>{formatdate(stamp, localtime=rng.random() < 0.3)}</pubDate>"
+            f'<guid isPermaLink="false">pubmed:{index}-{i}</guid></item>'
+            for i, stamp in enumerate(stamps)
+        )
+        documents.append(f'<rss version="2.0"><channel>{items}</channel></rss>')
+    return [feedparser.parse(x).entries for x in documents]
+
+
+def legacy_combine_feeds(feeds: list) -> list:
+    """combine_feeds before the parsed dates and merge"""
+    combined_feed = [item for feed in feeds for item in feed]
+    combined_feed.sort(
+        key=lambda x: dateutil.parser.parse(x["published"]), reverse=True
+    )
+    return combined_feed
+
+
+def to_articles(feed: list) -> list:
+    return [Article(x.id, x.title, "", "", (), "", published_time(x)) for x in feed]
+
+
+def main():
+    feeds = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    size = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+    items = make_feeds(feeds, size)
+    count = feeds * size
+
+    start = time.perf_counter()
+    legacy = legacy_combine_feeds(items)
+    legacy_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    articles = [to_articles(x) for x in items]
+    dates_time = time.perf_counter() - start
+    start = time.perf_counter()
+    merged = combine_feeds(articles)
+    merge_time = time.perf_counter() - start
+
+    # the fallback parser, for items without published_parsed
+    start = time.perf_counter()
+    fallback = [published_time({"published": x["published"]}) for x in legacy]
+    fallback_time = time.perf_counter() - start
+
+    assert [x.id for x in legacy] == [x.id for x in merged], "orders disagree"
+    assert fallback == [x.published for x in merged], "fallback dates disagree"
+
+    print(f"entries:  {count}")
+    print(f"legacy:   {legacy_time * 1000:.1f} ms")
+    print(f"dates:    {dates_time * 1000:.1f} ms (records with parsed dates)")
+    print(f"merge:    {merge_time * 1000:.1f} ms")
+    print(f"fallback: {fallback_time * 1000:.1f} ms (email parser on {count} dates)")
+    print(f"speedup:  {legacy_time / (dates_time + merge_time):.1f}x")
+
+
+if __name__ == "__main__":
+    main()
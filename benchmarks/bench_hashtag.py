@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Speed of insert_hashtag on a large set of PubMed-like titles.
+
+Compares the former keyword by keyword insertion with the compiled
+HashtagInserter and checks that both produce the same titles.
+
+    python benchmarks/bench_hashtag.py [number of titles]
+"""
+import os
+import random
+import re
+import sys
+import time
+
+# run from the checkout, not from an installed copy of scibot
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scibot.tools import Settings, insert_hashtag
+
+OPENERS = [
+    "Effects of",
+    "A randomized controlled trial of",
+    "Long-term outcomes after",
+    "Safety and efficacy of",
+    "Attitudes towards",
+    "Neural correlates of",
+    "A systematic review of",
+]
+TOPICS = [
+    "psilocybin",
+    "Psilocybin",
+    "psilocybine",
+    "MDMA-assisted psychotherapy",
+    "ketamine",
+    "5-MeO-DMT",
+    "ayahuasca ceremonies",
+    "drug checking services",
+    "Drug Policy reform",
+    "harm reduction programs",
+    "methadone maintenance",
+    "opioid overdose",
+    "microdosing",
+    "serotonergic psychedelics",
+    "hallucinogenic drugs",
+    "cannabis use",
+    "alcohol dependence",
+    "sleep quality",
+]
+CONTEXTS = [
+    "in treatment-resistant depression",
+    "among people who use drugs",
+    "and neurogenesis in adult mice",
+    "in primary care: a cohort study",
+    "during the COVID-19 pandemic",
+    "in healthy volunteers",
+    "- a psychopharmacology perspective",
+]
+
+
+def make_titles(size: int, seed: int = 42) -> list:
+    """synthetic PubMed titles built from typical openers, topics and contexts"""
+    rng = random.Random(seed)
+    return [
+        " ".join(
+            [rng.choice(OPENERS), rng.choice(TOPICS)]
+            + rng.sample(TOPICS, rng.randint(0, 2))
+            + [rng.choice(CONTEXTS)]
+        )
+        for _ in range(size)
+    ]
+
+
+def legacy_insert_hashtag(title: str) -> str:
+    """insert_hashtag before the compiled inserter"""
+    for x in Settings.add_hashtag:
+        if re.search(fr"\b{x}", title.lower()):
+            pos = (re.search(fr"\b{x}", title.lower())).start()
+            if " " in x:
+                title = title[:pos] + "#" + title[pos:].replace(" ", "", 1)
+            else:
+                title = title[:pos] + "#" + title[pos:]
+    return title
+
+
+def main():
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    titles = make_titles(size)
+
+    start = time.perf_counter()
+    legacy = [legacy_insert_hashtag(x) for x in titles]
+    legacy_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    compiled = [insert_hashtag(x) for x in titles]
+    compiled_time = time.perf_counter() - start
+
+    assert legacy == compiled, "compiled inserter disagrees with the legacy insertion"
+
+    print(f"titles:   {size}")
+    print(f"legacy:   {legacy_time:.2f} s  {size / legacy_time:,.0f} titles/s")
+    print(f"compiled: {compiled_time:.2f} s  {size / compiled_time:,.0f} titles/s")
+    print(f"speedup:  {legacy_time / compiled_time:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Import time of every CLI command, measured with `python -X importtime`.
+
+Each command is imported in a fresh interpreter several times, the median
+time spent importing modules after interpreter startup is compared with
+the command budget, and the heaviest imports are listed. Exits with 1 if a
+command is over its budget, so it can run on CI.
+
+    python benchmarks/bench_import.py [--runs 5] [--budget rto=300 ...]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+# milliseconds a command may spend importing modules
+BUDGETS = {"help": 20, "rto": 300}
+
+# modules a run of the command imports lazily, on top of load_command
+RUN_IMPORTS = {"rss": ["scibot.feeds"], "sch": ["scibot.feeds"]}
+
+COMMANDS = ["help", "rto", "rtg", "rtl", "glv", "rss", "sch"]
+
+
+def import_code(command: str) -> str:
+    if command == "help":
+        return "import scibot.cli"
+    if command == "all":
+        # everything, as the former entry point in scibot.what_a_c imported
+        return "import scibot.what_a_c, scibot.feeds, bs4, dateutil.parser"
+    modules = "".join(f"import {x}; " for x in RUN_IMPORTS.get(command, []))
+    return f"from scibot.cli import load_command; load_command({command!r}); {modules}"
+
+
+def parse_importtime(stderr: str) -> list:
+    """
+    Returns: list of (depth, name, cumulative microseconds) of the importtime report
+
+    """
+    imports = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        _, cumulative, name = line[len("import time:") :].split("|")
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        imports.append((depth, name.strip(), int(cumulative)))
+    return imports
+
+
+def measure(command: str, startup: set, env: dict, cwd: str) -> tuple:
+    """
+    Returns: milliseconds of imports after startup, and the top-level
+        imports not in `startup` with their milliseconds
+
+    """
+    output = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", import_code(command)],
+        env=env,
+        cwd=cwd,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    heaviest = {}
+    nested = []
+    total = 0
+    # nested imports are reported before the import they belong to
+    for depth, name, cumulative in parse_importtime(output.stderr):
+        if depth > 0:
+            nested.append((depth, name, cumulative))
+            continue
+        if name not in startup:
+            total += cumulative
+            for depth, name, cumulative in nested + [(0, name, cumulative)]:
+                if depth <= 1 and not name.startswith("scibot"):
+                    heaviest[name] = max(heaviest.get(name, 0), cumulative / 1000)
+        nested = []
+    return total / 1000, heaviest
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget", nargs="+", default=[], help="command=milliseconds")
+    parser.add_argument("--commands", nargs="+", default=COMMANDS, choices=COMMANDS)
+    args = parser.parse_args()
+    budgets = dict(BUDGETS)
+    budgets.update((x.split("=")[0], float(x.split("=")[1])) for x in args.budget)
+
+    env = dict(os.environ)
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [root, env.get("PYTHONPATH")]))
+    # the bot log file is written to the working directory
+    cwd = tempfile.mkdtemp(prefix="scibot-import-")
+    baseline = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "pass"],
+        env=env,
+        cwd=cwd,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    startup = {name for depth, name, _ in parse_importtime(baseline.stderr) if depth == 0}
+
+    over = []
+    print(f"{'command':8} {'median ms':>10} {'budget':>7}  heaviest imports")
+    for command in args.commands + ["all"]:
+        runs = [measure(command, startup, env, cwd) for _ in range(args.runs)]
+        median = statistics.median(x[0] for x in runs)
+        heaviest = sorted(runs[-1][1].items(), key=lambda x: -x[1])[:4]
+        budget = budgets.get(command)
+        if budget is not None and median > budget:
+            over.append(command)
+        print(
+            f"{command:8} {median:>10.1f} {budget or '-':>7}  "
+            + ", ".join(f"{name} {ms:.0f}" for name, ms in heaviest)
+        )
+
+    if over:
+        print(f"over budget: {', '.join(over)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Throughput of the filter_tweet keyword test on a synthetic tweet corpus.
+
+Compares the former per-keyword substring scan with the compiled
+TopicMatcher and checks that both find the same keywords.
+
+    python benchmarks/bench_matcher.py [number of tweets]
+"""
+import os
+import random
+import sys
+import time
+
+# run from the checkout, not from an installed copy of scibot
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scibot.matcher import compile_topic_matcher
+from scibot.tools import Settings
+
+FILLER = (
+    "the a of new study results show people who use we in on for is via read "
+    "thread today research data patients trial more https t co policy drugs "
+    "health harm reduction clinic evidence support care access"
+).split()
+
+
+def make_corpus(size: int, seed: int = 42) -> list:
+    """synthetic tweets mixing filler words with include/watch/exclude keywords"""
+    rng = random.Random(seed)
+    keywords = (
+        Settings.add_hashtag
+        + Settings.retweet_include_words
+        + Settings.watch_add_hashtag
+        + Settings.retweet_exclude_words
+    )
+    corpus = []
+    for _ in range(size):
+        words = [rng.choice(FILLER) for _ in range(rng.randint(8, 45))]
+        for _ in range(rng.randint(0, 3)):
+            keyword = rng.choice(keywords)
+            words.insert(rng.randrange(len(words)), rng.choice([keyword, "#" + keyword]))
+        corpus.append(" ".join(words).capitalize())
+    return corpus
+
+
+def legacy_match(end_status: str) -> list:
+    """keyword test of filter_tweet before the compiled matcher"""
+    joined_list = Settings.add_hashtag + Settings.retweet_include_words
+    return [
+        x
+        for x in joined_list + Settings.watch_add_hashtag
+        if x in end_status.lower()
+        and not any(
+            [x for x in Settings.retweet_exclude_words if x in end_status.lower()]
+        )
+    ]
+
+
+def main():
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    corpus = make_corpus(size)
+
+    start = time.perf_counter()
+    matcher = compile_topic_matcher(
+        tuple(Settings.add_hashtag + Settings.retweet_include_words),
+        tuple(Settings.watch_add_hashtag),
+        tuple(Settings.retweet_exclude_words),
+    )
+    compile_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    legacy = [legacy_match(x) for x in corpus]
+    legacy_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    compiled = [matcher.match(x) for x in corpus]
+    compiled_time = time.perf_counter() - start
+
+    assert legacy == compiled, "compiled matcher disagrees with the legacy scan"
+
+    print(f"tweets:   {size}")
+    print(f"compile:  {compile_time * 1000:.2f} ms")
+    print(f"legacy:   {legacy_time:.2f} s  {size / legacy_time:,.0f} tweets/s")
+    print(f"compiled: {compiled_time:.2f} s  {size / compiled_time:,.0f} tweets/s")
+    print(f"speedup:  {legacy_time / compiled_time:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+Run the bot commands offline against synthetic data at increasing scale.
+
+Twitter, PubMed and Telegram are replaced by the stand-ins of harness.py,
+each command and scale runs in a fresh process with its own home folder,
+so nothing touches the network or the real bot state. Reports wall time,
+API calls, peak traced allocations and peak RSS; --json saves the results
+for comparison between runs, e.g. on CI.
+
+    python benchmarks/bench_pipeline.py [--commands rss rtg rtl glv rto]
+        [--scales 1 4 16] [--latency 0.0] [--replay fixture.jsonl] [--json out.json]
+
+Pacing delays of the bot (Settings.thread_reply_delay, Settings.fav_delay)
+are set to zero, the optional latency simulates the network instead.
+"""
+import argparse
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import feedparser
+
+COMMANDS = ["rss", "rtg", "rtl", "glv", "rto"]
+
+
+def run_command(command: str, scale: int, latency: float, trace: bool, replay: str) -> dict:
+    """run one command in this process, set up with the offline stand-ins"""
+    home = tempfile.mkdtemp(prefix="scibot-bench-")
+    os.environ["HOME"] = home
+    os.chdir(home)  # the bot log file is written to the working directory
+
+    from harness import FakeServer, FakeTwitterAPI, ReplayAPI, save_feed_fixtures
+
+    feeds = save_feed_fixtures(os.path.join(home, "fixtures"), 5, 100 * scale)
+    server = FakeServer(feeds, latency)
+
+    from scibot.tools import Settings
+
+    Settings.thread_reply_delay = 0
+    Settings.fav_delay = (0, 0)
+
+    from scibot import telebot
+    from scibot.client import twitter_client
+    from scibot.feeds import feed_loader
+    from scibot.store import get_state_store
+    import scibot.what_a_c as what_a_c
+    from scibot.cli import main
+
+    telebot.notifier.url = server.telegram_url
+    feed_loader.feed_urls = server.feed_urls
+    if replay:
+        api = ReplayAPI(replay, latency)
+    else:
+        api = FakeTwitterAPI(scale, latency, on_response=twitter_client.rate_limits.observe)
+    twitter_client._api = api
+
+    # state of a bot that has been running for a while
+    # read from the fixtures, so the feed loader and its caches start cold
+    rng = random.Random(7)
+    state = get_state_store()
+    articles = [x.id for path in feeds for x in feedparser.parse(path).entries]
+    own_tweets = api.add_own_tweets(100 * scale) if not replay else []
+    with state.transaction() as conn:
+        conn.executemany(
+            "INSERT INTO publications (article_id, tweet_id, count) VALUES (?, ?, ?)",
+            [
+                (x, rng.choice(own_tweets) if own_tweets else 1, rng.randint(1, 3))
+                for x in articles[len(articles) // 50 :]
+            ],
+        )
+        conn.executemany(
+            "INSERT OR IGNORE INTO users (user_id, follower, interactions) VALUES (?, ?, ?)",
+            [
+                (str(1000 + rng.randrange(200 * scale)), int(rng.random() < 0.1), rng.randint(1, 9))
+                for _ in range(150 * scale)
+            ],
+        )
+    what_a_c.print = lambda *args, **kwargs: None
+
+    sys.argv = ["scibot", command]
+    if trace:
+        tracemalloc.start()
+    start = time.perf_counter()
+    main()
+    wall = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1] if trace else None
+    tracemalloc.stop()
+    telebot.notifier.flush()
+    server.close()
+
+    return {
+        "command": command,
+        "scale": scale,
+        "wall_s": round(wall, 4),
+        "api_calls": dict(api.calls),
+        "http_requests": dict(server.requests),
+        "telegram_messages": len(server.messages),
+        "alloc_peak_mb": round(peak / 2 ** 20, 2) if trace else None,
+        "max_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+
+
+def run_isolated(command: str, scale: int, latency: float, trace: bool, replay: str) -> dict:
+    """run a command in a fresh interpreter, so RSS and caches start from scratch"""
+    env = dict(os.environ)
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [root, env.get("PYTHONPATH")]))
+    args = [
+        sys.executable,
+        os.path.abspath(__file__),
+        "--child",
+        command,
+        "--scale",
+        str(scale),
+        "--latency",
+        str(latency),
+    ]
+    if trace:
+        args.append("--trace")
+    if replay:
+        args += ["--replay", os.path.abspath(replay)]
+    output = subprocess.run(args, env=env, capture_output=True, text=True, check=True)
+    return json.loads(output.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--commands", nargs="+", default=COMMANDS, choices=COMMANDS)
+    parser.add_argument("--scales", nargs="+", type=int, default=[1, 4, 16])
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds per call")
+    parser.add_argument("--replay", help="fixture saved by harness.RecordingAPI")
+    parser.add_argument("--json", help="file to save the results to")
+    parser.add_argument("--child", choices=COMMANDS, help=argparse.SUPPRESS)
+    parser.add_argument("--scale", type=int, default=1, help=argparse.SUPPRESS)
+    parser.add_argument("--trace", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        result = run_command(args.child, args.scale, args.latency, args.trace, args.replay)
+        print(json.dumps(result))
+        return
+
+    results = []
+    print(f"{'command':8} {'scale':>5} {'wall s':>8} {'calls':>6} {'alloc MiB':>10} {'RSS MiB':>8}")
+    for scale in args.scales:
+        for command in args.commands:
+            # tracemalloc slows the run down, allocations are measured apart
+            result = run_isolated(command, scale, args.latency, False, args.replay)
+            traced = run_isolated(command, scale, args.latency, True, args.replay)
+            result["alloc_peak_mb"] = traced["alloc_peak_mb"]
+            results.append(result)
+            print(
+                f"{command:8} {scale:>5} {result['wall_s']:>8.3f} "
+                f"{sum(result['api_calls'].values()):>6} "
+                f"{result['alloc_peak_mb']:>10.2f} {result['max_rss_mb']:>8.1f}"
+            )
+
+    if args.json:
+        with open(args.json, "w") as output:
+            json.dump(results, output, indent=2)
+
+
+if __name__ == "__main__":
+    main()
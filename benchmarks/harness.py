@@ -0,0 +1,467 @@
+"""
+Offline stand-ins for Twitter, PubMed and Telegram, used by bench_pipeline.py.
+
+- FakeTwitterAPI answers the tweepy.API methods used by the bot from
+  synthetic tweepy models, with a configurable latency and per-endpoint
+  rate limits reported through the same x-rate-limit headers as Twitter.
+- RecordingAPI wraps a live tweepy.API and saves every answer to a fixture
+  file, ReplayAPI serves a saved fixture back.
+- FakeServer is a local HTTP server serving saved RSS feed fixtures and
+  accepting Telegram sendMessage requests.
+"""
+import collections
+import json
+import os
+import random
+import threading
+import time
+import types
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import tweepy
+from tweepy.models import Status
+
+from scibot.tools import Settings
+
+# rate limits per 15 minutes window of the read endpoints
+DEFAULT_LIMITS = {
+    "search": 180,
+    "list_timeline": 900,
+    "statuses_lookup": 900,
+    "get_status": 900,
+    "retweets": 75,
+    "user_timeline": 900,
+}
+
+# request paths of the read endpoints, as tweepy.API sends them
+TWEEPY_PATHS = {
+    "search": "/search/tweets.json",
+    "list_timeline": "/lists/statuses.json",
+    "statuses_lookup": "/statuses/lookup.json",
+    "get_status": "/statuses/show.json?id={id}",
+    "retweets": "/statuses/retweets/{id}.json",
+    "user_timeline": "/statuses/user_timeline.json",
+}
+
+TOPICS = Settings.add_hashtag + Settings.retweet_include_words
+FILLER = (
+    "new study results show people who use we in on for via read thread "
+    "today research data patients trial more policy health evidence care"
+).split()
+CREATED_AT = "Wed Oct 10 20:19:24 +0000 2018"
+
+
+def user_json(user_id: int, rng: random.Random) -> dict:
+    return {
+        "id": user_id,
+        "id_str": str(user_id),
+        "screen_name": f"user{user_id}",
+        "followers_count": rng.randint(0, 20000),
+        "friends_count": rng.randint(0, 5000),
+    }
+
+
+def status_json(status_id: int, text: str, user: dict, rng: random.Random) -> dict:
+    return {
+        "id": status_id,
+        "id_str": str(status_id),
+        "created_at": CREATED_AT,
+        "full_text": text,
+        "text": text,
+        "retweet_count": rng.randint(0, 60),
+        "favorite_count": rng.randint(0, 120),
+        "is_quote_status": False,
+        "retweeted": False,
+        "favorited": False,
+        "user": user,
+    }
+
+
+def tweet_text(rng: random.Random, on_topic: float) -> str:
+    words = [rng.choice(FILLER) for _ in range(rng.randint(6, 30))]
+    if rng.random() < on_topic:
+        for _ in range(rng.randint(1, 3)):
+            words.insert(rng.randrange(len(words)), rng.choice(TOPICS))
+    return " ".join(words)
+
+
+class FakeTwitterAPI:
+    """
+    In-memory stand-in for tweepy.API over a synthetic timeline.
+
+    Returns tweepy models built from Twitter-like json, sleeps `latency`
+    seconds per call and raises tweepy.RateLimitError once an endpoint
+    used up its `limits` for the window. Every read call reports its
+    rate limit headers to `on_response`, like the pooled sessions do.
+    """
+
+    def __init__(
+        self,
+        scale: int = 1,
+        latency: float = 0.0,
+        limits: dict = None,
+        on_response=None,
+        seed: int = 42,
+    ):
+        """
+
+        Args:
+            scale: size of the synthetic data, 500 tweets and 200 users per unit
+            latency: seconds each call takes
+            limits: calls allowed per window by read endpoint, DEFAULT_LIMITS by default
+            on_response: callable receiving a response-like object after each read call
+            seed: seed of the synthetic data
+        """
+        self.rng = random.Random(seed)
+        self.latency = latency
+        self.limits = dict(DEFAULT_LIMITS if limits is None else limits)
+        self.on_response = on_response
+        self.calls = collections.Counter()
+        self.window_reset = time.time() + Settings.rate_limit_window
+        self.used = collections.Counter()
+        self.retweeted = set()
+        self.faved = set()
+        self._lock = threading.Lock()
+        self._retweets = {}
+
+        self.users = [user_json(1000 + i, self.rng) for i in range(200 * scale)]
+        self.statuses = {}
+        self.timeline = []
+        self.next_id = 10 ** 15
+        for _ in range(500 * scale):
+            self._add(self._make_status())
+
+    # synthetic data
+
+    def _make_status(self, text: str = None, user: dict = None) -> dict:
+        self.next_id += self.rng.randint(1, 1000)
+        data = status_json(
+            self.next_id,
+            text or tweet_text(self.rng, 0.3),
+            user or self.rng.choice(self.users),
+            self.rng,
+        )
+        if self.timeline and self.rng.random() < 0.1:
+            # quote an earlier tweet, sometimes one deleted since
+            quoted = self.rng.choice(self.timeline)
+            data["is_quote_status"] = True
+            data["quoted_status_id_str"] = (
+                quoted.id_str if self.rng.random() < 0.8 else str(quoted.id + 1)
+            )
+        elif self.timeline and self.rng.random() < 0.15:
+            original = self.rng.choice(self.timeline)
+            data["retweeted_status"] = original._json
+            data["full_text"] = "RT " + original.full_text
+        return data
+
+    def _add(self, data: dict) -> Status:
+        status = Status.parse(None, data)
+        self.statuses[status.id_str] = status
+        self.timeline.append(status)
+        return status
+
+    def add_own_tweets(self, count: int) -> list:
+        """
+        Returns: ids of `count` new tweets of the bot, as posted by earlier RSS jobs
+        """
+        user = user_json(1, self.rng)
+        return [
+            self._add(self._make_status(tweet_text(self.rng, 1.0), user)).id
+            for _ in range(count)
+        ]
+
+    # call accounting
+
+    def _call(self, method: str, id=None) -> None:
+        with self._lock:
+            self.calls[method] += 1
+            if self.latency:
+                time.sleep(self.latency)
+            if method not in self.limits:
+                return
+            now = time.time()
+            if now >= self.window_reset:
+                self.window_reset = now + Settings.rate_limit_window
+                self.used.clear()
+            self.used[method] += 1
+            remaining = max(self.limits[method] - self.used[method], 0)
+            response = types.SimpleNamespace(
+                url="https://api.twitter.com/1.1" + TWEEPY_PATHS[method].format(id=id),
+                status_code=200 if self.used[method] <= self.limits[method] else 429,
+                headers={
+                    "x-rate-limit-limit": str(self.limits[method]),
+                    "x-rate-limit-remaining": str(remaining),
+                    "x-rate-limit-reset": str(int(self.window_reset)),
+                },
+            )
+        if self.on_response is not None:
+            self.on_response(response)
+        if response.status_code == 429:
+            raise tweepy.RateLimitError("Rate limit exceeded", response)
+
+    def _page(self, count=20, since_id=None, max_id=None, **kwargs) -> list:
+        page = []
+        for status in reversed(self.timeline):
+            if max_id is not None and status.id > max_id:
+                continue
+            if since_id is not None and status.id <= since_id:
+                break
+            page.append(status)
+            if len(page) >= count:
+                break
+        return page
+
+    # tweepy.API methods used by the bot
+
+    def search(self, q=None, **kwargs):
+        self._call("search")
+        return self._page(**kwargs)
+
+    def list_timeline(self, list_id=None, **kwargs):
+        self._call("list_timeline")
+        return self._page(**kwargs)
+
+    def statuses_lookup(self, id_, **kwargs):
+        self._call("statuses_lookup")
+        return [self.statuses[str(x)] for x in id_ if str(x) in self.statuses]
+
+    def get_status(self, id, **kwargs):
+        self._call("get_status", id)
+        if str(id) not in self.statuses:
+            raise tweepy.TweepError("No status found with that ID.", api_code=144)
+        return self.statuses[str(id)]
+
+    def retweets(self, id, **kwargs):
+        self._call("retweets", id)
+        if str(id) not in self._retweets:
+            original = self.statuses.get(str(id))
+            text = original.full_text if original is not None else ""
+            self._retweets[str(id)] = [
+                Status.parse(
+                    None,
+                    {
+                        **status_json(
+                            self.next_id + 10 ** 12 + i,
+                            "RT " + text,
+                            self.rng.choice(self.users),
+                            self.rng,
+                        ),
+                        "retweeted_status": original._json if original else None,
+                    },
+                )
+                for i in range(self.rng.randint(0, 20))
+            ]
+        return self._retweets[str(id)]
+
+    def retweet(self, id, **kwargs):
+        self._call("retweet")
+        if str(id) in self.retweeted:
+            raise tweepy.TweepError(
+                "You have already retweeted this Tweet.", api_code=327
+            )
+        self.retweeted.add(str(id))
+        return self.statuses.get(str(id))
+
+    def unretweet(self, id, **kwargs):
+        self._call("unretweet")
+        self.retweeted.discard(str(id))
+        return self.statuses.get(str(id))
+
+    def create_favorite(self, id, **kwargs):
+        self._call("create_favorite")
+        if str(id) in self.faved:
+            raise tweepy.TweepError(
+                "You have already favorited this status.", api_code=139
+            )
+        self.faved.add(str(id))
+        return self.statuses.get(str(id))
+
+    def update_status(self, status=None, **kwargs):
+        self._call("update_status")
+        return self._add(self._make_status(status, user_json(1, self.rng)))
+
+
+def _model_to_json(result):
+    if isinstance(result, list):
+        return [_model_to_json(x) for x in result]
+    return getattr(result, "_json", result)
+
+
+def _json_to_model(result):
+    if isinstance(result, list):
+        return [_json_to_model(x) for x in result]
+    if isinstance(result, dict) and "id_str" in result:
+        return Status.parse(None, result)
+    return result
+
+
+def _call_key(method: str, args: tuple, kwargs: dict) -> str:
+    return json.dumps([method, args, sorted(kwargs.items())], default=str)
+
+
+class RecordingAPI:
+    """
+    Wrap a live tweepy.API and append every call and its answer to a fixture file.
+    """
+
+    def __init__(self, api, path: str):
+        self.api = api
+        self.path = path
+        self._lock = threading.Lock()
+
+    def __getattr__(self, name):
+        attr = getattr(self.api, name)
+        if not callable(attr):
+            return attr
+
+        def call(*args, **kwargs):
+            result = attr(*args, **kwargs)
+            record = {
+                "key": _call_key(name, args, kwargs),
+                "result": _model_to_json(result),
+            }
+            with self._lock, open(self.path, "a") as fixture:
+                fixture.write(json.dumps(record, default=str) + "\n")
+            return result
+
+        return call
+
+
+class ReplayAPI:
+    """
+    Serve the answers of a fixture saved by RecordingAPI, in recorded order
+    for repeated calls, without any network.
+    """
+
+    def __init__(self, path: str, latency: float = 0.0):
+        self.latency = latency
+        self.calls = collections.Counter()
+        self._answers = collections.defaultdict(collections.deque)
+        with open(path) as fixture:
+            for line in fixture:
+                record = json.loads(line)
+                self._answers[record["key"]].append(record["result"])
+
+    def __getattr__(self, name):
+        def call(*args, **kwargs):
+            self.calls[name] += 1
+            if self.latency:
+                time.sleep(self.latency)
+            answers = self._answers.get(_call_key(name, args, kwargs))
+            if not answers:
+                raise tweepy.TweepError(f"no recorded answer for {name}")
+            result = answers[0] if len(answers) == 1 else answers.popleft()
+            return _json_to_model(result)
+
+        return call
+
+
+def make_feed_fixture(index: int, size: int, rng: random.Random) -> str:
+    """synthetic PubMed RSS feed, entries newest first"""
+    items = []
+    now = time.time()
+    for i in range(size):
+        pmid = 30000000 + index * 100000 + i
+        abstract = tweet_text(rng, 1.0) + " " + " ".join(
+            rng.choice(FILLER) for _ in range(rng.randint(150, 300))
+        )
+        doi = f"10.1177/{pmid}"
+        body = (
+            f"<p>J Psychopharmacol. 2021. doi: {doi}.</p>"
+            f"<p><b>ABSTRACT</b></p><p><b>BACKGROUND:</b> {abstract}</p>"
+            f'<p>PMID:<a href="https://pubmed.ncbi.nlm.nih.gov/{pmid}/">{pmid}</a> | '
+            f'DOI:<a href="https://doi.org/{doi}">{doi}</a></p>'
+        )
+        items.append(
+            f"<item><title>{tweet_text(rng, 1.0).capitalize()}</title>"
+            f"<link>https://pubmed.ncbi.nlm.nih.gov/{pmid}/</link>"
+            f"<description><![CDATA[{body}]]></description>"
+            f"<content:encoded><![CDATA[{body}]]></content:encoded>"
+            f"<dc:creator>Author {rng.randint(1, 999)}</dc:creator>"
+            f"<pubDate>{formatdate(now - i * 3600 - index)}</pubDate>"
+            f'<guid isPermaLink="false">pubmed:{pmid}</guid></item>'
+        )
+    return (
+        '<?xml version="1.0"?><rss version="2.0" '
+        'xmlns:content="http://purl.org/rss/1.0/modules/content/" '
+        'xmlns:dc="http://purl.org/dc/elements/1.1/"><channel>'
+        f"<title>PubMed {index}</title>{''.join(items)}</channel></rss>"
+    )
+
+
+def save_feed_fixtures(directory: str, feeds: int, size: int, seed: int = 42) -> list:
+    """
+    Write synthetic RSS feeds to `directory`.
+
+    Returns: paths of the feed fixtures
+
+    """
+    rng = random.Random(seed)
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for index in range(feeds):
+        path = os.path.join(directory, f"feed-{index}.xml")
+        with open(path, "w") as fixture:
+            fixture.write(make_feed_fixture(index, size, rng))
+        paths.append(path)
+    return paths
+
+
+class FakeServer:
+    """
+    Local HTTP server standing in for PubMed RSS feeds and the Telegram bot API.
+
+    GET /feed/<n> serves the n-th feed fixture, GET /bot<token>/sendMessage
+    records the message. Both answer after `latency` seconds.
+    """
+
+    def __init__(self, feed_paths: list, latency: float = 0.0):
+        self.feed_paths = feed_paths
+        self.latency = latency
+        self.messages = []
+        self.requests = collections.Counter()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if server.latency:
+                    time.sleep(server.latency)
+                url = urlparse(self.path)
+                if url.path.startswith("/feed/"):
+                    server.requests["feed"] += 1
+                    with open(server.feed_paths[int(url.path.split("/")[-1])], "rb") as f:
+                        body = f.read()
+                    self.send_response(200)
+                    self.send_header("Content-Type", "application/rss+xml")
+                elif url.path.endswith("/sendMessage"):
+                    server.requests["telegram"] += 1
+                    server.messages.append(parse_qs(url.query).get("text", [""])[0])
+                    body = b'{"ok": true}'
+                    self.send_response(200)
+                    self.send_header("Content-Type", "application/json")
+                else:
+                    body = b""
+                    self.send_response(404)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.httpd.server_port}"
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    @property
+    def feed_urls(self) -> list:
+        return [f"{self.url}/feed/{index}" for index in range(len(self.feed_paths))]
+
+    @property
+    def telegram_url(self) -> str:
+        return self.url + "/bot{token}/sendMessage"
+
+    def close(self) -> None:
+        self.httpd.shutdown()
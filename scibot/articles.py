@@ -0,0 +1,283 @@
+import calendar
+import re
+import threading
+from collections import OrderedDict
+from email.utils import mktime_tz, parsedate_tz
+from html import unescape
+
+from scibot.metrics import metrics
+from scibot.tools import logger, Settings
+
+# a well-formed start or end tag, quoted attribute values may contain ">"
+_TAG = re.compile(
+    r"""<(?:[a-zA-Z][^\s/>"'=]*"""
+    r"""(?:\s+[^\s/>"'=]+(?:\s*=\s*(?:"[^"]*"|'[^']*'|[^\s"'>]+))?)*\s*/?"""
+    r"""|/[a-zA-Z][^\s/>"'=]*\s*)>"""
+)
+# markup the tag pattern does not cover: comments, declarations...
+_OTHER_MARKUP = re.compile(r"<[a-zA-Z/!?]")
+# elements whose content is raw or keeps its whitespace, and line ends the
+# html parser rewrites
+_UNSUPPORTED = re.compile(r"<(?:script|style|pre|textarea)|\r", re.I)
+# character references decoded the same by html.unescape and BeautifulSoup
+_SIMPLE_REFS = re.compile(r"&(?:(?:amp|lt|gt|quot|nbsp);|#(?:\d+|[xX][0-9a-fA-F]+);)")
+_ASCII_SPACES = frozenset("\x20\x0a\x09\x0c\x0d")
+
+
+def _is_simple_ref(match) -> bool:
+    ref = match.group()
+    if ref[1] != "#":
+        return True
+    code = int(ref[3:-1], 16) if ref[2] in "xX" else int(ref[2:-1])
+    # BeautifulSoup reads 128-159 as windows-1252, html.unescape drops
+    # surrogates and non-characters
+    return 0 < code < 128 or 159 < code < 0xD800
+
+
+def _segment_text(segment: str):
+    """decoded text between two tags, None if it needs the html parser"""
+    if _OTHER_MARKUP.search(segment):
+        return None
+    if "&" in segment:
+        refs = list(_SIMPLE_REFS.finditer(segment))
+        if segment.count("&") != len(refs) or not all(map(_is_simple_ref, refs)):
+            return None
+        segment = unescape(segment)
+    # BeautifulSoup keeps a single space or line end of blank strings
+    if segment and _ASCII_SPACES.issuperset(segment):
+        return "\n" if "\n" in segment else " "
+    return segment
+
+
+def html_to_text(html: str) -> str:
+    """
+    Text content of an html fragment, as BeautifulSoup(html).get_text().
+
+    Plain tags and common character references are stripped and decoded
+    with regular expressions, fragments with any other markup go through
+    BeautifulSoup.
+
+    Args:
+        html: html fragment
+
+    Returns: text of the fragment
+
+    """
+    if not _UNSUPPORTED.search(html):
+        pieces = [_segment_text(x) for x in _TAG.split(html)]
+        if None not in pieces:
+            return "".join(pieces)
+    # imported on first use, most abstracts never need it
+    from bs4 import BeautifulSoup
+
+    return BeautifulSoup(html, "html.parser").get_text()
+
+
+def published_time(item) -> float:
+    """
+    Publication time of a feed item.
+
+    Uses the date feedparser already parsed, else reads the RFC 822 date
+    with the email parser, dateutil is only tried on other formats.
+
+    Args:
+        item: RSS feed item
+
+    Returns: seconds since the epoch, 0 if the item has no date
+
+    """
+    parsed = item.get("published_parsed")
+    if parsed:
+        return float(calendar.timegm(parsed))
+    published = item.get("published")
+    if not published:
+        return 0.0
+    parsed = parsedate_tz(published)
+    if parsed:
+        return float(mktime_tz(parsed))
+    import dateutil.parser
+
+    return dateutil.parser.parse(published).timestamp()
+
+
+_DOI_LINK = re.compile('DOI:<a href="([^"]*)">')
+
+
+def return_doi_str(article):
+    """return doi link if exists"""
+    html = [article.get("description", "")] + [x.value for x in article.get("content", [])]
+    for value in html:
+        title_search = _DOI_LINK.search(value)
+        if title_search:
+            return title_search.group(1)
+    return article.link
+
+
+class Article:
+    """
+    Compact, immutable record of a feed publication.
+
+    Only what compose_message and post_thread need is kept, the feed item
+    itself (raw html, links, detail dicts) is dropped once parsed. Items
+    are also read like the former make_literature_dict dictionaries.
+
+    Records are built when a feed is downloaded, not when an article is
+    posted: holding the raw html until then would keep most of the feed
+    item in memory and in the feed cache file. ArticleCache parses each
+    entry once, so a download only parses the entries it has not seen.
+    """
+
+    __slots__ = ("id", "title", "abstract", "link", "authors", "author", "published")
+
+    def __init__(
+        self,
+        id: str,
+        title: str,
+        abstract: str,
+        link: str,
+        authors: tuple,
+        author: str,
+        published: float,
+    ):
+        """
+
+        Args:
+            id: feed entry id
+            title: publication title
+            abstract: abstract as plain text
+            link: DOI link, or the entry link if there is none
+            authors: author names
+            author: author line of the entry
+            published: publication time, seconds since the epoch
+        """
+        for name, value in zip(
+            self.__slots__, (id, title, abstract, link, tuple(authors), author, published)
+        ):
+            object.__setattr__(self, name, value)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+    __delattr__ = __setattr__
+
+    def __getitem__(self, key: str):
+        if key == "author-s":
+            return ["Authors: " + ", ".join(self.authors), "Author: " + self.author]
+        if key in self.__slots__:
+            return getattr(self, key)
+        raise KeyError(key)
+
+    def __repr__(self) -> str:
+        return f"Article({self.id!r}, {self.title!r})"
+
+    def as_dict(self) -> dict:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "Article":
+        return cls(**data)
+
+    @classmethod
+    def from_entry(cls, item):
+        """
+        Parse a PubMed RSS entry.
+
+        Args:
+            item: RSS feed item
+
+        Returns: Article, or None if the entry has no abstract
+
+        """
+        if not hasattr(item, "content") or "No abstract" in item.description:
+            return None
+        return cls(
+            id=item.id,
+            title=item.title,
+            abstract=html_to_text(item.content[0].value).split("ABSTRACT")[1],
+            link=return_doi_str(item),
+            authors=[x["name"] for x in item.authors],
+            author=item.author,
+            published=published_time(item),
+        )
+
+
+class ArticleCache:
+    """
+    Articles by entry id, least recently used are evicted first, so only
+    new feed entries are parsed when a feed is downloaded again.
+    """
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.parsed = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, item):
+        """
+        Args:
+            item: RSS feed item
+
+        Returns: the Article of the entry, parsed now if not cached yet, or
+            None if the entry can not be posted
+
+        """
+        with self._lock:
+            if item.id in self._data:
+                self.hits += 1
+                self._data.move_to_end(item.id)
+                return self._data[item.id]
+        try:
+            article = Article.from_entry(item)
+        except (AttributeError, IndexError, KeyError, ValueError) as e:
+            logger.warning(f"unparseable feed entry {item.get('id')}: {e!r}")
+            article = None
+        with self._lock:
+            self.parsed += 1
+            self._data[item.id] = article
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+        return article
+
+    def metric_samples(self) -> list:
+        """
+        Returns: (name, labels, value) samples of the cache
+
+        """
+        return [
+            ("cache_hits_total", {"cache": "article"}, self.hits),
+            ("cache_misses_total", {"cache": "article"}, self.parsed),
+            ("cache_size", {"cache": "article"}, len(self._data)),
+        ]
+
+    def add(self, article: Article) -> None:
+        """
+        Remember an article loaded from the persisted feed cache.
+        """
+        with self._lock:
+            self._data[article.id] = article
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+
+def parse_entries(entries) -> list:
+    """
+    Turn feed items into Articles, one at a time, skipping those without abstract.
+
+    Args:
+        entries: iterable of RSS feed items
+
+    Returns: list of Article
+
+    """
+    articles = []
+    for item in entries:
+        article = article_cache.get(item)
+        if article is not None:
+            articles.append(article)
+    return articles
+
+
+article_cache = ArticleCache(Settings.article_cache_size)
+metrics.add_collector(article_cache.metric_samples)
@@ -0,0 +1,206 @@
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+import tweepy
+
+from scibot.client import StatusResolver
+from scibot.telebot import telegram_bot_sendtext
+from scibot.tools import logger, Settings
+from scibot.what_a_c import (
+    twitter_setup,
+    search_sources,
+    poll_new_statuses,
+    poll_pages,
+    save_cursors,
+    filter_repeated_tweets,
+    filter_tweet,
+    fav_or_tweet,
+    original_tweet_id,
+)
+
+
+class CallBudgetExceeded(Exception):
+    """raised when a cycle has used all the API calls it may prefetch with"""
+
+
+class AsyncTwitter:
+    """
+    Run blocking Twitter calls of one cycle concurrently.
+
+    Calls run on a thread pool, at most `concurrency` at a time, and stop
+    once `budget` calls were made so a cycle can not drain the rate limits.
+    """
+
+    def __init__(self, twitter_api, concurrency: int, budget: int):
+        """
+
+        Args:
+            twitter_api: tweepy.API or TwitterClient
+            concurrency: calls in flight at the same time
+            budget: calls allowed for the cycle
+        """
+        self.twitter_api = twitter_api
+        self.budget = budget
+        self.calls = 0
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._executor = ThreadPoolExecutor(
+            max_workers=concurrency, thread_name_prefix="scibot-async"
+        )
+
+    async def run(self, func, *args, **kwargs):
+        """
+        Run a blocking function making one API call.
+        """
+        async with self._semaphore:
+            if self.exhausted:
+                raise CallBudgetExceeded(f"{self.calls} calls made this cycle")
+            self.calls += 1
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(
+                self._executor, functools.partial(func, *args, **kwargs)
+            )
+
+    async def call(self, name: str, *args, **kwargs):
+        """
+        Call a tweepy API method by name.
+        """
+        return await self.run(getattr(self.twitter_api, name), *args, **kwargs)
+
+    @property
+    def exhausted(self) -> bool:
+        return self.calls >= self.budget
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=False)
+
+
+def _failed(results, what: str) -> list:
+    """
+    Log the failed calls of a prefetch, once if the call budget ran out.
+
+    Returns: list of booleans, True for each failed call
+
+    """
+    budget_errors = [x for x in results if isinstance(x, CallBudgetExceeded)]
+    if budget_errors:
+        logger.info(f"{what} prefetch stopped: {budget_errors[0]}")
+    for result in results:
+        if isinstance(result, Exception) and not isinstance(result, CallBudgetExceeded):
+            logger.warning(f"{what} prefetch failed: {result}")
+    return [isinstance(x, Exception) for x in results]
+
+
+async def _prefetch_quoted(client: AsyncTwitter, resolver: StatusResolver, statuses):
+    if client.exhausted:
+        return
+    chunks = resolver.unresolved(
+        [x.quoted_status_id_str for x in statuses if x.is_quote_status]
+    )
+    results = await asyncio.gather(
+        *(
+            client.call("statuses_lookup", chunk, tweet_mode=resolver.tweet_mode)
+            for chunk in chunks
+        ),
+        return_exceptions=True,
+    )
+    for chunk, result, failed in zip(chunks, results, _failed(results, "quoted statuses")):
+        if not failed:
+            resolver.record(chunk, result)
+
+
+async def _prefetch_retweeters(client: AsyncTwitter, resolver: StatusResolver, max_val):
+    if client.exhausted:
+        return
+    # fav_or_tweet walks the candidates from the best ranked one, and mostly
+    # stops at the first ones
+    tweet_ids = [x[1] for x in reversed(max_val)][: Settings.candidate_prefetch]
+    # the candidates may still need a lookup, which blocks: off the loop
+    loop = asyncio.get_running_loop()
+    statuses = await loop.run_in_executor(None, resolver.resolve, tweet_ids)
+    results = await asyncio.gather(
+        *(
+            client.call(
+                "retweets",
+                original_tweet_id(statuses.get(str(tweet_id)), tweet_id),
+                tweet_mode="extended",
+            )
+            for tweet_id in tweet_ids
+        ),
+        return_exceptions=True,
+    )
+    for result, failed in zip(results, _failed(results, "retweeters")):
+        if not failed:
+            resolver.add(*result)
+
+
+async def search_and_retweet_async(flag: str = "global_search", count: int = 100):
+    """
+    Concurrent version of search_and_retweet.
+
+    The timelines of the flag are polled together, then the quoted tweets
+    and the retweeter lists of the candidates are fetched concurrently so
+    the act stage finds them in the resolver and the client caches.
+
+    Args:
+        flag: `global_search`, `list_search` or `give_love`
+        count: Number of tweets to search for
+
+    Returns: None
+
+    """
+    twitter_api = twitter_setup()
+    client = AsyncTwitter(
+        twitter_api, Settings.async_concurrency, Settings.async_call_budget
+    )
+    sources = search_sources(twitter_api, flag)
+    try:
+        try:
+            polls = await asyncio.gather(
+                *(
+                    client.run(
+                        poll_new_statuses,
+                        fetch,
+                        source,
+                        count,
+                        poll_pages(twitter_api, flag, source),
+                    )
+                    for source, fetch in sources.items()
+                )
+            )
+        except tweepy.TweepError as e:
+            logger.exception(e.reason)
+            telegram_bot_sendtext(f"ERROR : {e.reason}")
+            return
+        except CallBudgetExceeded as e:
+            logger.warning(f"async cycle {flag}: no calls left to poll, {e}")
+            return
+
+        search_results = [status for statuses, _ in polls for status in statuses]
+        cursors = {source: newest_id for source, (_, newest_id) in zip(sources, polls)}
+
+        unique_results = filter_repeated_tweets(search_results, flag)
+        resolver = StatusResolver(twitter_api)
+        resolver.add(*unique_results)
+        await _prefetch_quoted(client, resolver, unique_results)
+
+        # get the best ranked tweets and retweet the first one that works
+        max_val = filter_tweet(unique_results, twitter_api, resolver)
+        await _prefetch_retweeters(client, resolver, max_val)
+
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(
+            None, fav_or_tweet, max_val, flag, twitter_api, resolver
+        )
+        logger.debug(f"async cycle {flag}: {client.calls} prefetch calls")
+
+        save_cursors(cursors)
+    finally:
+        client.close()
+
+
+def run_search_and_retweet_async(flag: str = "global_search", count: int = 100):
+    """
+    Blocking entry point of the async pipeline, for the CLI and the scheduler.
+    """
+    asyncio.run(search_and_retweet_async(flag, count))
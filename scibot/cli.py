@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+import functools
+import sys
+from contextlib import nullcontext
+
+# command -> description, the modules of a command are imported by load_command
+COMMANDS = {
+    "rss": "Read URL and post new items to Twitter",
+    "rtg": "Search and retweet keywords from global feed",
+    "rtl": "Search and retweet keywords from list feed",
+    "glv": "Fav tweets from list or globally",
+    "rto": "Retweet last own tweet",
+    "sch": "Run scheduled jobs on infinite loop",
+    "help": "Show this help screen",
+}
+
+# search commands -> flag of search_and_retweet
+SEARCH_FLAGS = {"rtg": "global_search", "rtl": "list_search", "glv": "give_love"}
+
+
+def main():
+    """
+    Main function of scibot
+
+    Only the modules needed by the command are imported, so `help` or a
+    mistyped command return right away.
+
+    """
+    command = sys.argv[1].lower() if len(sys.argv) > 1 else "help"
+    if command not in COMMANDS or command == "help":
+        display_help()
+        return
+
+    from scibot.telebot import telegram_bot_sendtext
+    from scibot.tools import logger
+
+    logger.info("\n### sciBot started ###\n\n")
+    try:
+        from scibot.profiling import get_profiler
+        from scibot.store import get_state_store
+
+        get_state_store()
+        options = sys.argv[2:]
+        profiler = get_profiler(options)
+        run = load_command(command, options, profiler)
+        # under sch every job run is profiled on its own
+        profiling = (
+            profiler.profile(command)
+            if profiler is not None and command != "sch"
+            else nullcontext()
+        )
+        with profiling:
+            run()
+
+    except Exception as e:
+        logger.exception(e, exc_info=True)
+        telegram_bot_sendtext(f"[Exception] {e}")
+
+    except IOError as errno:
+        logger.exception(f"[ERROR] {errno}")
+        telegram_bot_sendtext(f"[ERROR] {errno}")
+
+    logger.info("\n\n### sciBot finished ###")
+
+
+def load_command(command: str, options: list = (), profiler=None):
+    """
+    Import the modules a command needs.
+
+    Args:
+        command: one of COMMANDS, but help
+        options: command line options following the command
+        profiler: Profiler for the jobs of sch, if any
+
+    Returns: function running the command
+
+    """
+    if command == "rss":
+        from scibot.what_a_c import read_rss_and_tweet
+
+        return read_rss_and_tweet
+    if command == "rto":
+        from scibot.what_a_c import retweet_old_own
+
+        return retweet_old_own
+
+    if "--async" in options:
+        from scibot.async_pipeline import run_search_and_retweet_async as search
+    else:
+        from scibot.what_a_c import search_and_retweet as search
+    if command in SEARCH_FLAGS:
+        return functools.partial(search, SEARCH_FLAGS[command])
+    if command == "sch":
+        from scibot.what_a_c import run_scheduled_jobs
+
+        return functools.partial(run_scheduled_jobs, search, profiler)
+    raise ValueError(f"unknown command {command}")
+
+
+def display_help():
+    """
+    Show available commands.
+
+    Returns: Prints available commands
+
+    """
+
+    print("Syntax: python {} [command] [option]".format(sys.argv[0]))
+    print()
+    print(" Commands:")
+    for command, description in COMMANDS.items():
+        print(f"    {command:6} {description}")
+    print()
+    print(" Options:")
+    print("    --async  Run the searches of rtg, rtl, glv and sch concurrently")
+    print("    --profile[=cprofile|sample]")
+    print("             Profile the command, or every job run of sch, into")
+    print("             Settings.profile_dir (also set by SCIBOT_PROFILE)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,398 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager, nullcontext
+
+import requests
+import tweepy
+import tweepy.binder
+from requests.adapters import HTTPAdapter
+
+from scibot.metrics import metrics
+from scibot.ratelimit import RESOURCES, RateLimitPlanner
+from scibot.tools import logger, Settings
+
+
+class _PooledAdapter(HTTPAdapter):
+    """
+    HTTPAdapter outliving the short-lived sessions tweepy opens on every call.
+    """
+
+    def close(self):
+        # tweepy closes its session after each call, keep the pool alive
+        pass
+
+    def close_pool(self):
+        super().close()
+
+
+class _ClientRequests:
+    """
+    Stand-in for the `requests` module used by tweepy.binder.
+
+    tweepy 3 builds a new requests.Session per API call. While a TwitterClient
+    makes a request on the current thread, the sessions made here mount its
+    connection pool, so keep-alive connections are reused across calls and
+    threads while headers and params stay per call, and carry its response
+    hooks, e.g. to read the rate limit headers. Any other tweepy.API of the
+    process gets a plain session, as with `requests` itself.
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+
+    @contextmanager
+    def pooled(self, adapter: HTTPAdapter, hooks=()):
+        """
+        Make the sessions built on this thread use a connection pool.
+
+        Args:
+            adapter: adapter holding the connection pool
+            hooks: response hooks of the sessions
+        """
+        previous = getattr(self._local, "pool", None)
+        self._local.pool = (adapter, list(hooks))
+        try:
+            yield
+        finally:
+            self._local.pool = previous
+
+    def Session(self) -> requests.Session:
+        session = requests.Session()
+        pool = getattr(self._local, "pool", None)
+        if pool is not None:
+            adapter, hooks = pool
+            session.mount("https://", adapter)
+            session.hooks["response"].extend(hooks)
+        return session
+
+    def __getattr__(self, name):
+        return getattr(requests, name)
+
+
+_client_requests = _ClientRequests()
+tweepy.binder.requests = _client_requests
+
+
+def _is_recoverable(error: tweepy.TweepError, name: str) -> bool:
+    """
+    Revoked/expired auth is fixed by a new client, and so are connection
+    failures, but a call that may have been sent is only repeated if it reads
+    """
+    if error.response is None:
+        return name in RESOURCES
+    return error.response.status_code == 401
+
+
+class TTLCache:
+    """
+    Bounded LRU mapping whose entries expire `ttl` seconds after being stored.
+    """
+
+    def __init__(self, ttl: float, maxsize: int):
+        """
+
+        Args:
+            ttl: seconds an entry is served from the cache
+            maxsize: number of entries kept, least recently used are evicted first
+        """
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """
+        Returns: (True, value) on a hit, (False, None) on a miss
+
+        """
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None and item[0] > time.monotonic():
+                self._data.move_to_end(key)
+                self.hits += 1
+                return True, item[1]
+            if item is not None:
+                del self._data[key]
+            self.misses += 1
+            return False, None
+
+    def set(self, key, value) -> None:
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "size": len(self._data)}
+
+
+class TwitterClient:
+    """
+    Long-lived tweepy.API shared by all jobs and scheduler threads.
+
+    The API object and its pool of keep-alive connections are built on first
+    use. A call failing on an authentication error, or a read failing on a
+    connection error, rebuilds both and is retried once. Writes are not
+    repeated after a connection error, they may have reached Twitter, and
+    every other error reaches the caller as usual.
+
+    Rate limits are tracked by a RateLimitPlanner instead of tweepy's
+    wait_on_rate_limit: only a call on an exhausted endpoint waits for the
+    window to reset, and the scheduler defers jobs before they run dry.
+
+    get_status, statuses_lookup, retweets and list_timeline are answered
+    from TTL/LRU caches configured on Settings.twitter_cache, statuses are
+    cached one by one so every call returning statuses feeds the others.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._api = None
+        self._adapter = None
+        self.rate_limits = RateLimitPlanner()
+        self.caches = {
+            kind: TTLCache(ttl, maxsize)
+            for kind, (ttl, maxsize) in Settings.twitter_cache.items()
+        }
+
+    @property
+    def api(self) -> tweepy.API:
+        api = self._api
+        if api is None:
+            with self._lock:
+                if self._api is None:
+                    self._build()
+                api = self._api
+        return api
+
+    def _build(self) -> None:
+        self._adapter = _PooledAdapter(
+            pool_connections=Settings.twitter_pool_connections,
+            pool_maxsize=Settings.twitter_pool_size,
+        )
+        # Authenticate and access using keys:
+        auth = tweepy.OAuthHandler(
+            os.getenv("CONSUMER_KEY"), os.getenv("CONSUMER_SECRET")
+        )
+        auth.set_access_token(os.getenv("ACCESS_TOKEN"), os.getenv("ACCESS_SECRET"))
+
+        self._api = tweepy.API(auth, timeout=Settings.twitter_timeout)
+
+    def reset(self) -> None:
+        """
+        Drop the API object and close its connections, the next call rebuilds them.
+        """
+        with self._lock:
+            if self._adapter is not None:
+                self._adapter.close_pool()
+            self._api = None
+            self._adapter = None
+
+    def cache_stats(self) -> dict:
+        """
+        Returns: hit/miss counters and size of every cache
+
+        """
+        return {kind: cache.stats() for kind, cache in self.caches.items()}
+
+    def metric_samples(self) -> list:
+        """
+        Returns: (name, labels, value) samples of the caches and rate limits
+
+        """
+        samples = []
+        for kind, stats in self.cache_stats().items():
+            samples.append(("cache_hits_total", {"cache": kind}, stats["hits"]))
+            samples.append(("cache_misses_total", {"cache": kind}, stats["misses"]))
+            samples.append(("cache_size", {"cache": kind}, stats["size"]))
+        limits = self.rate_limits.stats()
+        for resource, bucket in limits["endpoints"].items():
+            samples.append(("rate_limit_remaining", {"resource": resource}, bucket["remaining"]))
+            samples.append(("rate_limit_reset_seconds", {"resource": resource}, bucket["reset_in"]))
+        samples.append(("rate_limit_waits_total", {}, limits["waits"]))
+        samples.append(("rate_limit_waited_seconds_total", {}, limits["waited_seconds"]))
+        samples.append(("rate_limit_deferred_jobs_total", {}, limits["deferred_jobs"]))
+        return samples
+
+    def _call(self, name: str, *args, **kwargs):
+        self.rate_limits.acquire(name)
+        try:
+            return self._request(name, *args, **kwargs)
+        except tweepy.RateLimitError:
+            # the response headers emptied the bucket, wait for the reset
+            logger.warning(f"rate limited on {name}")
+            self.rate_limits.acquire(name)
+            return self._request(name, *args, **kwargs)
+        except tweepy.TweepError as e:
+            if not _is_recoverable(e, name):
+                raise
+            logger.warning(f"rebuilding twitter client after {name}: {e}")
+            self.reset()
+            return self._request(name, *args, **kwargs)
+
+    def _request(self, name: str, *args, **kwargs):
+        # timed apart from _call, so rate limit waits do not count as latency
+        with self._lock:
+            if self._api is None:
+                self._build()
+            api, adapter = self._api, self._adapter
+        pooled = (
+            _client_requests.pooled(adapter, [self.rate_limits.observe])
+            if adapter is not None
+            else nullcontext()
+        )
+        with metrics.span("twitter_call_seconds", method=name), pooled:
+            return getattr(api, name)(*args, **kwargs)
+
+    def _cache_statuses(self, statuses: list, tweet_mode) -> None:
+        for status in statuses:
+            self.caches["status"].set((status.id_str, tweet_mode), status)
+
+    def get_status(self, id, *args, **kwargs):
+        key = (str(id), kwargs.get("tweet_mode"))
+        hit, status = self.caches["status"].get(key)
+        if not hit:
+            status = self._call("get_status", id, *args, **kwargs)
+            self.caches["status"].set(key, status)
+        return status
+
+    def statuses_lookup(self, id_, *args, **kwargs):
+        tweet_mode = kwargs.get("tweet_mode")
+        found = {}
+        missing = []
+        for tweet_id in id_:
+            hit, status = self.caches["status"].get((str(tweet_id), tweet_mode))
+            if hit:
+                found[str(tweet_id)] = status
+            else:
+                missing.append(tweet_id)
+        if missing:
+            statuses = self._call("statuses_lookup", missing, *args, **kwargs)
+            self._cache_statuses(statuses, tweet_mode)
+            found.update((x.id_str, x) for x in statuses)
+        return [found[str(x)] for x in id_ if str(x) in found]
+
+    def retweets(self, id, *args, **kwargs):
+        key = (str(id), args, tuple(sorted(kwargs.items())))
+        hit, statuses = self.caches["retweets"].get(key)
+        if not hit:
+            statuses = self._call("retweets", id, *args, **kwargs)
+            self.caches["retweets"].set(key, statuses)
+            self._cache_statuses(statuses, kwargs.get("tweet_mode"))
+        return statuses
+
+    def list_timeline(self, *args, **kwargs):
+        key = (args, tuple(sorted(kwargs.items())))
+        hit, statuses = self.caches["list_timeline"].get(key)
+        if not hit:
+            statuses = self._call("list_timeline", *args, **kwargs)
+            self.caches["list_timeline"].set(key, statuses)
+            self._cache_statuses(statuses, kwargs.get("tweet_mode"))
+        return statuses
+
+    def __getattr__(self, name):
+        attr = getattr(self.api, name)
+        if not callable(attr):
+            return attr
+
+        def call(*args, **kwargs):
+            return self._call(name, *args, **kwargs)
+
+        return call
+
+
+class StatusResolver:
+    """
+    Resolve tweet ids to statuses for one search cycle, in bulk.
+
+    Statuses already at hand (search results, retweeters, embedded retweeted
+    and quoted statuses) are remembered, the remaining ids are fetched with
+    statuses_lookup, up to 100 ids per call, instead of one get_status each.
+    """
+
+    lookup_size = 100
+
+    def __init__(self, twitter_api, tweet_mode: str = "extended"):
+        """
+
+        Args:
+            twitter_api: tweepy.API or TwitterClient used for the lookups
+            tweet_mode: tweet mode of the looked up statuses
+        """
+        self.twitter_api = twitter_api
+        self.tweet_mode = tweet_mode
+        self._statuses = {}
+        self._missing = set()
+
+    def add(self, *statuses) -> None:
+        """
+        Remember statuses, and the statuses embedded on them, as resolved.
+        """
+        for status in statuses:
+            self._statuses.setdefault(status.id_str, status)
+            for embedded in ("retweeted_status", "quoted_status"):
+                if hasattr(status, embedded):
+                    self.add(getattr(status, embedded))
+
+    def resolve(self, tweet_ids) -> dict:
+        """
+        Look up every id not resolved yet, in as few calls as possible.
+
+        Args:
+            tweet_ids: iterable of tweet ids
+
+        Returns: dictionary of id_str -> tweepy.Status for the ids that exist
+
+        """
+        tweet_ids = [str(x) for x in tweet_ids]
+        for chunk in self.unresolved(tweet_ids):
+            self.record(
+                chunk, self.twitter_api.statuses_lookup(chunk, tweet_mode=self.tweet_mode)
+            )
+        return {x: self._statuses[x] for x in tweet_ids if x in self._statuses}
+
+    def unresolved(self, tweet_ids) -> list:
+        """
+        Args:
+            tweet_ids: iterable of tweet ids
+
+        Returns: the ids neither resolved nor known missing, in lookup sized chunks
+
+        """
+        wanted = list(
+            dict.fromkeys(
+                x
+                for x in map(str, tweet_ids)
+                if x not in self._statuses and x not in self._missing
+            )
+        )
+        return [
+            wanted[index : index + self.lookup_size]
+            for index in range(0, len(wanted), self.lookup_size)
+        ]
+
+    def record(self, tweet_ids: list, statuses: list) -> None:
+        """
+        Store the result of a lookup, ids without a status are known missing.
+        """
+        self.add(*statuses)
+        self._missing.update(x for x in map(str, tweet_ids) if x not in self._statuses)
+
+    def get(self, tweet_id):
+        """
+        Args:
+            tweet_id: tweet id
+
+        Returns: tweepy.Status, or None if the tweet does not exist anymore
+
+        """
+        return self.resolve([tweet_id]).get(str(tweet_id))
+
+
+twitter_client = TwitterClient()
+metrics.add_collector(twitter_client.metric_samples)
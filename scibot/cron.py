@@ -0,0 +1,97 @@
+import datetime
+
+# name, lowest and highest value of the fields of a cron expression
+FIELDS = (
+    ("minute", 0, 59),
+    ("hour", 0, 23),
+    ("day", 1, 31),
+    ("month", 1, 12),
+    ("weekday", 0, 7),
+)
+
+# years searched for a matching time before an expression is deemed impossible
+MAX_YEARS = 5
+
+
+def _parse_field(text: str, name: str, low: int, high: int) -> frozenset:
+    values = set()
+    for part in text.split(","):
+        spec, slash, step = part.partition("/")
+        try:
+            step = int(step) if slash else 1
+            if spec == "*":
+                start, end = low, high
+            elif "-" in spec:
+                start, end = (int(x) for x in spec.split("-", 1))
+            else:
+                start = int(spec)
+                end = high if slash else start
+        except ValueError:
+            raise ValueError(f"invalid {name} field {text!r}") from None
+        if not low <= start <= end <= high or step < 1:
+            raise ValueError(f"{name} field {text!r} out of range {low}-{high}")
+        values.update(range(start, end + 1, step))
+    return frozenset(values)
+
+
+class CronExpression:
+    """
+    A cron schedule: minute, hour, day of month, month and day of week
+    (0 or 7 = Sunday), each field "*", a number, a range "a-b" or a list
+    of those, optionally with a step "/n", e.g. "20 */3 * * *".
+
+    Like cron, when both the day of month and the day of week are
+    restricted a day matching either one is due.
+    """
+
+    def __init__(self, expression: str):
+        """
+
+        Args:
+            expression: five space separated fields
+        """
+        fields = expression.split()
+        if len(fields) != len(FIELDS):
+            raise ValueError(f"cron expression {expression!r} needs {len(FIELDS)} fields")
+        self.expression = expression
+        self.minutes, self.hours, self.days, self.months, weekdays = (
+            _parse_field(text, *field) for text, field in zip(fields, FIELDS)
+        )
+        self.weekdays = frozenset(x % 7 for x in weekdays)
+        self._any_day = fields[2] == "*"
+        self._any_weekday = fields[4] == "*"
+
+    def __repr__(self) -> str:
+        return f"CronExpression({self.expression!r})"
+
+    def _day_matches(self, t: datetime.datetime) -> bool:
+        in_days = t.day in self.days
+        # datetime counts weekdays from Monday, cron from Sunday
+        in_weekdays = (t.weekday() + 1) % 7 in self.weekdays
+        if self._any_day or self._any_weekday:
+            return in_days and in_weekdays
+        return in_days or in_weekdays
+
+    def next_after(self, after: datetime.datetime) -> datetime.datetime:
+        """
+        Args:
+            after: time to search from
+
+        Returns: the first due minute strictly after `after`
+
+        """
+        t = after.replace(second=0, microsecond=0) + datetime.timedelta(minutes=1)
+        limit = after.replace(year=after.year + MAX_YEARS, day=1)
+        while t < limit:
+            if t.month not in self.months:
+                year, month = divmod(t.year * 12 + t.month, 12)
+                t = t.replace(year=year, month=month + 1, day=1, hour=0, minute=0)
+            elif not self._day_matches(t):
+                t = t.replace(hour=0, minute=0) + datetime.timedelta(days=1)
+            elif t.hour not in self.hours:
+                t = t.replace(minute=0) + datetime.timedelta(hours=1)
+            elif t.minute not in self.minutes:
+                t += datetime.timedelta(minutes=1)
+            else:
+                return t
+        raise ValueError(f"cron expression {self.expression!r} is never due")
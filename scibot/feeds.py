@@ -0,0 +1,287 @@
+import heapq
+import json
+import operator
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import feedparser
+import requests
+
+from scibot.articles import Article, article_cache, parse_entries
+from scibot.metrics import metrics
+from scibot.tools import logger, Settings
+
+
+def _to_feedparser_dict(obj):
+    """rebuild FeedParserDict items from their json representation"""
+    if isinstance(obj, dict):
+        return feedparser.FeedParserDict(
+            {k: _to_feedparser_dict(v) for k, v in obj.items()}
+        )
+    if isinstance(obj, list):
+        return [_to_feedparser_dict(x) for x in obj]
+    return obj
+
+
+def load_feed_cache(filename: str) -> dict:
+    """
+    Read the persisted feed cache.
+
+    Args:
+        filename: Full path to the feed cache json file.
+
+    Returns: dictionary of feed url -> {etag, modified, fetched_at, entries}
+
+    """
+    if not os.path.isfile(filename):
+        return {}
+    try:
+        with open(filename, "r") as json_file:
+            cache = json.load(json_file)
+    except (IOError, ValueError) as e:
+        logger.error(f"unreadable feed cache, starting empty: {e}")
+        return {}
+    slots = set(Article.__slots__)
+    for feed in cache.values():
+        if all(slots == x.keys() for x in feed["entries"]):
+            feed["entries"] = [Article.from_dict(x) for x in feed["entries"]]
+            for article in feed["entries"]:
+                article_cache.add(article)
+        else:
+            # cache written before Article records: full feed items
+            feed["entries"] = parse_entries(_to_feedparser_dict(feed["entries"]))
+    return cache
+
+
+def save_feed_cache(cache: dict, filename: str) -> None:
+    """
+    Persist the feed cache, replacing the previous file atomically.
+
+    Args:
+        cache: dictionary of feed url -> {etag, modified, fetched_at, entries}
+        filename: Full path to the feed cache json file.
+
+    Returns: None
+
+    """
+    tmp_file = filename + ".tmp"
+    cache = {
+        url: {**feed, "entries": [x.as_dict() for x in feed["entries"]]}
+        for url, feed in cache.items()
+    }
+    try:
+        os.makedirs(os.path.dirname(os.path.abspath(filename)), exist_ok=True)
+        with open(tmp_file, "w") as json_file:
+            json.dump(cache, json_file, default=str)
+        os.replace(tmp_file, filename)
+    except IOError as e:
+        logger.exception(e)
+
+
+def fetch_feed(session: requests.Session, url: str, cached: dict) -> dict:
+    """
+    Download one RSS feed with a conditional GET.
+
+    Args:
+        session: requests session used for the download
+        url: RSS feed url
+        cached: previous cache record of the feed, or None
+
+    Returns: cache record of the feed, `cached` itself if the feed did not change
+
+    """
+    headers = {}
+    if cached:
+        if cached.get("etag"):
+            headers["If-None-Match"] = cached["etag"]
+        if cached.get("modified"):
+            headers["If-Modified-Since"] = cached["modified"]
+
+    try:
+        response = session.get(
+            url, headers=headers, timeout=Settings.feed_fetch_timeout
+        )
+        if response.status_code == 304 and cached:
+            cached["fetched_at"] = time.time()
+            return cached
+        response.raise_for_status()
+    except requests.RequestException as e:
+        logger.error(f"feed download failed {url}: {e}")
+        return cached
+
+    # keep Article records only, the parsed feed is dropped right away. The
+    # entries are parsed here rather than on first read: a download runs on
+    # the refresh thread, and only the entries new to article_cache are parsed
+    entries = parse_entries(
+        feedparser.parse(
+            response.content, response_headers={"content-location": url}
+        )["entries"]
+    )
+    return {
+        "etag": response.headers.get("ETag"),
+        "modified": response.headers.get("Last-Modified"),
+        "fetched_at": time.time(),
+        "entries": entries,
+    }
+
+
+def combine_feeds(feeds: list) -> list:
+    """
+    Merge the articles of several feeds, newest first.
+
+    Feeds come newest first already, so they are merged in a single pass,
+    a feed out of order is sorted on its own first.
+
+    Args:
+        feeds: list of lists of Article
+
+    Returns: list of Article sorted by publication date
+
+    """
+    key = operator.attrgetter("published")
+    ordered = []
+    for feed in feeds:
+        if any(key(x) < key(y) for x, y in zip(feed, feed[1:])):
+            feed = sorted(feed, key=key, reverse=True)
+        ordered.append(feed)
+    return list(heapq.merge(*ordered, key=key, reverse=True))
+
+
+class FeedLoader:
+    """
+    Lazy, cached loader for the combined RSS feed.
+
+    Nothing is downloaded until the feed is first requested, afterwards the
+    combined feed is kept for `ttl` seconds. `refresh_async` updates the cache
+    from a background thread so scheduled jobs find it already warm.
+
+    Feeds are downloaded in parallel with conditional requests, the ETag,
+    Last-Modified header and parsed items of every feed are persisted in
+    `cache_file` so unchanged feeds are neither downloaded nor parsed again,
+    not even after a restart.
+    """
+
+    def __init__(self, feed_urls: list, ttl: int, cache_file: str):
+        """
+
+        Args:
+            feed_urls: list of RSS feed urls to combine
+            ttl: seconds before the cached feed is considered stale
+            cache_file: Full path to the persisted feed cache
+        """
+        self.feed_urls = feed_urls
+        self.ttl = ttl
+        self.cache_file = cache_file
+        self._cache = None
+        self._entries = None
+        self._fetched_at = 0.0
+        self._lock = threading.Lock()
+        self._refresh_thread = None
+        self._session = None
+
+    def is_stale(self) -> bool:
+        return self._entries is None or time.time() - self._fetched_at > self.ttl
+
+    def get(self) -> list:
+        """
+        Return the combined feed, fetching it first if the cache is stale.
+
+        Returns: list of Article sorted by publication date
+
+        """
+        if self.is_stale():
+            with self._lock:
+                if self._cache is None:
+                    self._load_cache()
+                # a background refresh may have finished while we waited
+                if self.is_stale():
+                    self._refresh()
+        return self._entries
+
+    def refresh(self) -> list:
+        """
+        Fetch the feeds now, regardless of the cache age.
+
+        Returns: list of Article sorted by publication date
+
+        """
+        with self._lock:
+            if self._cache is None:
+                self._load_cache()
+            self._refresh()
+        return self._entries
+
+    def refresh_async(self) -> None:
+        """
+        Refresh the feeds from a daemon thread, unless one is already running.
+
+        Returns: None
+
+        """
+        if self._refresh_thread is not None and self._refresh_thread.is_alive():
+            return
+        self._refresh_thread = threading.Thread(
+            target=self.refresh, name="feed-refresh", daemon=True
+        )
+        self._refresh_thread.start()
+
+    def _load_cache(self) -> None:
+        self._cache = load_feed_cache(self.cache_file)
+        feeds = [self._cache[url] for url in self.feed_urls if url in self._cache]
+        if len(feeds) == len(self.feed_urls):
+            self._entries = combine_feeds([feed["entries"] for feed in feeds])
+            self._fetched_at = min(feed["fetched_at"] for feed in feeds)
+
+    @metrics.timed("feed_fetch")
+    def _refresh(self) -> None:
+        start = time.monotonic()
+        if self._session is None:
+            self._session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(
+                pool_maxsize=Settings.feed_fetch_workers
+            )
+            self._session.mount("https://", adapter)
+            self._session.mount("http://", adapter)
+
+        # the refresh takes as long as the slowest feed, not the sum of all
+        with ThreadPoolExecutor(max_workers=Settings.feed_fetch_workers) as pool:
+            results = list(
+                pool.map(
+                    lambda url: fetch_feed(self._session, url, self._cache.get(url)),
+                    self.feed_urls,
+                )
+            )
+
+        changed = False
+        for url, feed in zip(self.feed_urls, results):
+            if feed is None:
+                metrics.inc("feed_fetches_total", result="failed")
+                continue
+            updated = self._cache.get(url) is not feed
+            metrics.inc("feed_fetches_total", result="updated" if updated else "not_modified")
+            changed = changed or updated
+            self._cache[url] = feed
+
+        entries = self._entries
+        if changed or entries is None:
+            entries = combine_feeds(
+                [self._cache[url]["entries"] for url in self.feed_urls if url in self._cache]
+            )
+        if not entries and self._entries:
+            # keep serving the previous feed if every download failed
+            logger.warning("feed refresh returned no items, keeping cached feed")
+        else:
+            self._entries = entries
+        self._fetched_at = time.time()
+        save_feed_cache(self._cache, self.cache_file)
+        logger.info(
+            f"feed refreshed: {len(self._entries or [])} items, changed={changed} "
+            f"in {time.monotonic() - start:.2f}s"
+        )
+
+
+feed_loader = FeedLoader(
+    Settings.feed_urls, Settings.feed_cache_ttl, Settings.feed_cache_file
+)
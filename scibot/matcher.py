@@ -0,0 +1,256 @@
+import functools
+import re
+from collections import deque
+
+
+class KeywordMatcher:
+    """
+    Aho-Corasick automaton finding every keyword contained in a text.
+
+    The automaton is compiled once into a table of per-state transitions, a
+    search is a single pass over the text whatever the number of keywords.
+    Like `keyword in text`, keywords are matched as plain substrings.
+    """
+
+    def __init__(self, keywords):
+        """
+
+        Args:
+            keywords: iterable of keywords to search for
+        """
+        goto = [{}]
+        output = [set()]
+        for keyword in keywords:
+            state = 0
+            for char in keyword:
+                if char not in goto[state]:
+                    goto.append({})
+                    output.append(set())
+                    goto[state][char] = len(goto) - 1
+                state = goto[state][char]
+            output[state].add(keyword)
+
+        # breadth first, so the fallback of every state is done before its children
+        fail = [0] * len(goto)
+        order = []
+        queue = deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            order.append(state)
+            for char, child in goto[state].items():
+                fallback = fail[state]
+                while fallback and char not in goto[fallback]:
+                    fallback = fail[fallback]
+                fail[child] = goto[fallback].get(char, 0)
+                output[child] |= output[fail[child]]
+                queue.append(child)
+
+        # resolve the failure links ahead of time: one dict lookup per char
+        transitions = [None] * len(goto)
+        transitions[0] = dict(goto[0])
+        for state in order:
+            transitions[state] = {**transitions[fail[state]], **goto[state]}
+
+        self._transitions = transitions
+        self._output = [frozenset(x) for x in output]
+
+    def find(self, text: str) -> set:
+        """
+        Args:
+            text: text to search
+
+        Returns: set of the keywords found in the text
+
+        """
+        transitions = self._transitions
+        output = self._output
+        found = set(output[0])
+        state = 0
+        for char in text:
+            state = transitions[state].get(char, 0)
+            if output[state]:
+                found |= output[state]
+        return found
+
+
+class TopicMatcher:
+    """
+    Keyword test of filter_tweet: include, watch and exclude keywords found
+    together in one pass over the lower-cased tweet.
+    """
+
+    def __init__(self, include: tuple, watch: tuple, exclude: tuple):
+        """
+
+        Args:
+            include: keywords making a tweet on-topic
+            watch: keywords not enough on their own to make a tweet on-topic
+            exclude: keywords making a tweet off-topic
+        """
+        self.keywords = include + watch
+        self.watch = frozenset(watch)
+        self.exclude = frozenset(exclude)
+        self._matcher = KeywordMatcher(set(include + watch + exclude))
+
+    def match(self, text: str) -> list:
+        """
+        Args:
+            text: tweet text
+
+        Returns: include and watch keywords found in the text, in keyword
+            order, or an empty list if any exclude keyword is found
+
+        """
+        found = self._matcher.find(text.lower())
+        if found & self.exclude:
+            return []
+        return [x for x in self.keywords if x in found]
+
+    def is_on_topic(self, keyword_matches: list) -> bool:
+        """
+        Returns: True if a match is not only made of watch keywords
+
+        """
+        return any(x not in self.watch for x in keyword_matches)
+
+
+@functools.lru_cache(maxsize=8)
+def compile_topic_matcher(include: tuple, watch: tuple, exclude: tuple) -> TopicMatcher:
+    """
+    Build a TopicMatcher once per set of keyword lists.
+
+    Args:
+        include: keywords making a tweet on-topic
+        watch: keywords not enough on their own to make a tweet on-topic
+        exclude: keywords making a tweet off-topic
+
+    Returns: compiled TopicMatcher
+
+    """
+    return TopicMatcher(include, watch, exclude)
+
+
+# keywords with these characters are regular expressions, not plain text
+_PATTERN_CHARS = set(".^$*+?{}[]\\|()#")
+
+
+class HashtagInserter:
+    """
+    Insert a hash symbol in front of the first occurrence of every keyword.
+
+    Keyword positions are found with a single scan of one compiled
+    alternation and the output is built with a single join. Keywords are
+    handled in list order as if inserted one after the other: a keyword
+    with spaces loses its first space, and a keyword found where an earlier
+    one was already tagged gets a second hash. Titles where these edits
+    would change which occurrence a later keyword matches are rare, they go
+    through the keyword by keyword insertion instead.
+    """
+
+    def __init__(self, keywords):
+        """
+
+        Args:
+            keywords: keywords to tag, in priority order
+        """
+        self.keywords = list(keywords)
+        self._patterns = [re.compile(fr"\b{x}") for x in self.keywords]
+
+        unique = sorted(set(self.keywords), key=len, reverse=True)
+        self._scanner = None
+        if unique and all(
+            not (set(x) & _PATTERN_CHARS) and re.match(r"\w", x) for x in unique
+        ):
+            # longest alternative first: the lookahead reports the longest
+            # keyword at each word start, shorter ones there are its prefixes
+            self._scanner = re.compile(
+                r"\b(?=(" + "|".join(re.escape(x) for x in unique) + "))"
+            )
+            self._prefixes = {x: [y for y in unique if x.startswith(y)] for x in unique}
+            # character pairs of the keywords still to come, a removed space
+            # joining such a pair could create a new occurrence
+            self._later_pairs = []
+            for index in range(len(self.keywords)):
+                self._later_pairs.append(
+                    {
+                        x[i : i + 2]
+                        for x in self.keywords[index + 1 :]
+                        for i in range(len(x) - 1)
+                    }
+                )
+
+    def insert(self, title: str) -> str:
+        """
+        Args:
+            title: Text to parse for inserting hash symbols
+
+        Returns: Text with inserted hashtags
+
+        """
+        lowered = title.lower()
+        if self._scanner is None or len(lowered) != len(title):
+            return self._insert_sequential(title)
+
+        first = {}
+        for match in self._scanner.finditer(lowered):
+            for keyword in self._prefixes[match.group(1)]:
+                first.setdefault(keyword, match.start())
+        if not first:
+            return title
+
+        inserts = {}
+        deletes = set()
+        for index, keyword in enumerate(self.keywords):
+            pos = first.get(keyword)
+            if pos is None:
+                continue
+            end = pos + len(keyword)
+            # an earlier edit inside this occurrence changes what it matches
+            if any(pos < x < end for x in inserts) or any(
+                pos - 1 <= x < end for x in deletes
+            ):
+                return self._insert_sequential(title)
+            inserts[pos] = inserts.get(pos, 0) + 1
+            if " " in keyword:
+                space = pos + keyword.index(" ")
+                joined = lowered[space - 1] + lowered[space + 1 : space + 2]
+                if joined in self._later_pairs[index]:
+                    return self._insert_sequential(title)
+                deletes.add(space)
+
+        pieces = []
+        last = 0
+        for pos in sorted(inserts.keys() | deletes):
+            pieces.append(title[last:pos])
+            if pos in deletes:
+                last = pos + 1
+            else:
+                pieces.append("#" * inserts[pos])
+                last = pos
+        pieces.append(title[last:])
+        return "".join(pieces)
+
+    def _insert_sequential(self, title: str) -> str:
+        for x, pattern in zip(self.keywords, self._patterns):
+            match = pattern.search(title.lower())
+            if match:
+                pos = match.start()
+                if " " in x:
+                    title = title[:pos] + "#" + title[pos:].replace(" ", "", 1)
+                else:
+                    title = title[:pos] + "#" + title[pos:]
+        return title
+
+
+@functools.lru_cache(maxsize=8)
+def compile_hashtag_inserter(keywords: tuple) -> HashtagInserter:
+    """
+    Build a HashtagInserter once per keyword list.
+
+    Args:
+        keywords: keywords to tag, in priority order
+
+    Returns: compiled HashtagInserter
+
+    """
+    return HashtagInserter(keywords)
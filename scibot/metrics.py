@@ -0,0 +1,219 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+PREFIX = "scibot_"
+
+
+def _label_key(labels: dict) -> tuple:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(labels: tuple) -> str:
+    if not labels:
+        return ""
+    escaped = (
+        (k, v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for k, v in labels
+    )
+    return "{" + ",".join(f'{k}="{v}"' for k, v in escaped) + "}"
+
+
+class Metrics:
+    """
+    Thread-safe counters and timers of the bot, kept in memory.
+
+    Timers record count, total and longest duration per name and labels,
+    counters any running total. Collectors are callables returning samples
+    of state kept elsewhere (cache and rate limit statistics) at export
+    time. Everything is exported as Prometheus text or as json.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._timers = {}
+        self._collectors = []
+        self.started = time.time()
+
+    def inc(self, name: str, value: float = 1, **labels) -> None:
+        """
+        Add `value` to the counter `name` with the given labels.
+        """
+        key = (name, _label_key(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name: str, seconds: float, **labels) -> None:
+        """
+        Record a duration of `seconds` on the timer `name`.
+        """
+        key = (name, _label_key(labels))
+        with self._lock:
+            timer = self._timers.get(key)
+            if timer is None:
+                self._timers[key] = [1, seconds, seconds]
+            else:
+                timer[0] += 1
+                timer[1] += seconds
+                timer[2] = max(timer[2], seconds)
+
+    @contextmanager
+    def span(self, name: str, **labels):
+        """
+        Time the enclosed block on the timer `name`, an exception leaving
+        the block is counted on `errors_total` under the same labels.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            self.inc("errors_total", timer=name, **labels)
+            raise
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def timed(self, stage: str):
+        """
+        Decorator timing every call of a function as a pipeline stage.
+
+        Args:
+            stage: value of the `stage` label of the stage_seconds timer
+
+        """
+
+        def decorator(func):
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.span("stage_seconds", stage=stage):
+                    return func(*args, **kwargs)
+
+            return wrapper
+
+        return decorator
+
+    def add_collector(self, collector) -> None:
+        """
+        Args:
+            collector: callable returning a list of (name, labels, value) samples,
+        called on every export
+
+        """
+        self._collectors.append(collector)
+
+    def samples(self) -> list:
+        """
+        Returns: list of (name, type, labels, value), with timers split in
+            their _count, _sum and _max samples
+
+        """
+        with self._lock:
+            counters = list(self._counters.items())
+            timers = [(key, list(value)) for key, value in self._timers.items()]
+        samples = [(name, "counter", labels, value) for (name, labels), value in counters]
+        for (name, labels), (count, total, longest) in timers:
+            samples.append((name + "_count", "counter", labels, count))
+            samples.append((name + "_sum", "counter", labels, round(total, 6)))
+            samples.append((name + "_max", "gauge", labels, round(longest, 6)))
+        for collector in self._collectors:
+            try:
+                collected = collector()
+            except Exception:
+                self.inc("errors_total", timer="collector")
+                continue
+            samples.extend(
+                (
+                    name,
+                    "counter" if name.endswith("_total") else "gauge",
+                    _label_key(labels),
+                    value,
+                )
+                for name, labels, value in collected
+            )
+        samples.append(("uptime_seconds", "gauge", (), round(time.time() - self.started)))
+        return samples
+
+    def render(self) -> str:
+        """
+        Returns: the metrics in the Prometheus text exposition format
+
+        """
+        lines = []
+        typed = set()
+        for name, kind, labels, value in sorted(self.samples(), key=lambda x: x[0]):
+            if name not in typed:
+                typed.add(name)
+                lines.append(f"# TYPE {PREFIX}{name} {kind}")
+            lines.append(f"{PREFIX}{name}{_format_labels(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self) -> dict:
+        """
+        Returns: the metrics as json-serializable dict, name -> list of samples
+
+        """
+        snapshot = {"time": time.time(), "metrics": {}}
+        for name, _, labels, value in self.samples():
+            snapshot["metrics"].setdefault(name, []).append(
+                {"labels": dict(labels), "value": value}
+            )
+        return snapshot
+
+    def dump(self, filename: str) -> None:
+        """
+        Write a json snapshot of the metrics, replacing the previous one.
+        """
+        directory = os.path.dirname(filename)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp = f"{filename}.tmp"
+        with open(tmp, "w") as fp:
+            json.dump(self.snapshot(), fp, indent=1)
+        os.replace(tmp, filename)
+
+    def serve(self, port: int, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+        """
+        Serve the metrics on a background thread: /metrics as Prometheus
+        text, /metrics.json as json.
+
+        Args:
+            port: port to listen on, 0 picks a free one
+            host: address to bind, local only by default
+
+        Returns: the running server
+
+        """
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path == "/metrics":
+                    body = metrics.render().encode()
+                    content_type = "text/plain; version=0.0.4"
+                elif self.path == "/metrics.json":
+                    body = json.dumps(metrics.snapshot()).encode()
+                    content_type = "application/json"
+                else:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(
+            target=server.serve_forever, name="scibot-metrics", daemon=True
+        ).start()
+        return server
+
+
+metrics = Metrics()
@@ -0,0 +1,177 @@
+import cProfile
+import datetime
+import itertools
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+from scibot.tools import logger, Settings
+
+PROFILE_MODES = ("cprofile", "sample")
+
+
+class StackSampler:
+    """
+    Sample the call stacks of registered threads from a background thread.
+
+    Every `interval` seconds the current frame of each registered thread is
+    read with sys._current_frames() and its stack counted, the thread being
+    sampled runs at full speed in between.
+    """
+
+    def __init__(self, interval: float):
+        """
+
+        Args:
+            interval: seconds between samples
+        """
+        self.interval = interval
+        self._threads = {}
+        self._lock = threading.Lock()
+        self._worker = None
+
+    def register(self, thread_id: int) -> Counter:
+        """
+        Start sampling a thread.
+
+        Returns: counter of collapsed stacks, filled until unregister
+
+        """
+        stacks = Counter()
+        with self._lock:
+            self._threads[thread_id] = stacks
+            if self._worker is None:
+                self._worker = threading.Thread(
+                    target=self._run, name="scibot-sampler", daemon=True
+                )
+                self._worker.start()
+        return stacks
+
+    def unregister(self, thread_id: int) -> None:
+        with self._lock:
+            self._threads.pop(thread_id, None)
+
+    def _run(self) -> None:
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                if not self._threads:
+                    continue
+                frames = sys._current_frames()
+                for thread_id, stacks in self._threads.items():
+                    frame = frames.get(thread_id)
+                    if frame is not None:
+                        stacks[collapse(frame)] += 1
+
+
+def collapse(frame) -> str:
+    """
+    Returns: the stack of a frame in collapsed format, outermost call first,
+        one `module:function:line` per frame separated by semicolons
+
+    """
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        module = frame.f_globals.get("__name__", "?")
+        names.append(f"{module}:{code.co_name}:{code.co_firstlineno}")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+class Profiler:
+    """
+    Profile runs of the CLI commands and scheduled jobs one by one.
+
+    In "cprofile" mode a run is traced with cProfile, saved as a pstats
+    file, and its stacks are sampled into a collapsed-stack file for
+    flamegraph.pl or speedscope. The "sample" mode only samples the stacks,
+    cheap enough to leave on in production. Only the thread running the job
+    is profiled, work handed to other threads shows as waiting.
+    """
+
+    def __init__(self, mode: str, directory: str, interval: float):
+        """
+
+        Args:
+            mode: "cprofile" or "sample"
+            directory: folder the profiles are written to
+            interval: seconds between stack samples
+        """
+        if mode not in PROFILE_MODES:
+            raise ValueError(f"unknown profile mode {mode}, use one of {PROFILE_MODES}")
+        self.mode = mode
+        self.directory = directory
+        self.sampler = StackSampler(interval)
+        self._runs = itertools.count(1)
+
+    @contextmanager
+    def profile(self, name: str):
+        """
+        Profile the enclosed block as one run of `name`.
+
+        Args:
+            name: command or job name, used in the file names
+
+        """
+        thread_id = threading.get_ident()
+        profile = cProfile.Profile() if self.mode == "cprofile" else None
+        if profile is not None:
+            try:
+                profile.enable()
+            except ValueError as e:
+                # another profiler is active on this interpreter
+                logger.warning(f"cProfile unavailable for {name}, sampling only: {e}")
+                profile = None
+        stacks = self.sampler.register(thread_id)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            if profile is not None:
+                profile.disable()
+            self.sampler.unregister(thread_id)
+            self._save(name, profile, stacks, time.perf_counter() - start)
+
+    def _save(self, name: str, profile, stacks: Counter, seconds: float) -> None:
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            stamp = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+            base = os.path.join(
+                self.directory,
+                f"{name.replace(':', '-')}-{stamp}-{next(self._runs)}",
+            )
+            if profile is not None:
+                profile.dump_stats(f"{base}.prof")
+            with open(f"{base}.collapsed", "w") as fp:
+                for stack, count in stacks.most_common():
+                    fp.write(f"{stack} {count}\n")
+            logger.info(f"profiled {name} in {seconds:.2f}s: {base}")
+        except (IOError, OSError) as e:
+            logger.exception(e)
+
+
+def get_profiler(argv: list):
+    """
+    Build the profiler asked for by a `--profile[=mode]` option, or else
+    by the SCIBOT_PROFILE environment variable (a mode, or 1 for the
+    default mode of Settings.profile_mode).
+
+    Args:
+        argv: command line arguments following the command
+
+    Returns: Profiler, or None if profiling is off
+
+    """
+    mode = os.getenv("SCIBOT_PROFILE", "")
+    for arg in argv:
+        if arg == "--profile" or arg.startswith("--profile="):
+            mode = arg.partition("=")[2] or "1"
+    if mode.lower() in ("", "0", "false", "no"):
+        return None
+    if mode.lower() in ("1", "true", "yes"):
+        mode = Settings.profile_mode
+    return Profiler(mode.lower(), Settings.profile_dir, Settings.profile_interval)
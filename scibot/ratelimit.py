@@ -0,0 +1,212 @@
+import re
+import threading
+import time
+
+from scibot.tools import logger, Settings
+
+# Twitter rate limit resource of the tweepy API methods used by the bot
+RESOURCES = {
+    "search": "search/tweets",
+    "list_timeline": "lists/statuses",
+    "statuses_lookup": "statuses/lookup",
+    "get_status": "statuses/show",
+    "retweets": "statuses/retweets/:id",
+    "user_timeline": "statuses/user_timeline",
+}
+
+
+def resource_of(url: str) -> str:
+    """
+    Args:
+        url: url of a Twitter API v1.1 request
+
+    Returns: rate limit resource of the request, ids replaced with `:id`
+
+    """
+    path = url.split("?", 1)[0].split("/1.1/", 1)[-1]
+    if path.endswith(".json"):
+        path = path[: -len(".json")]
+    return re.sub(r"/\d+$", "/:id", path)
+
+
+class TokenBucket:
+    """
+    Calls left on one endpoint until its rate limit window resets.
+
+    Each call takes a token, the bucket is refilled to its limit when the
+    window resets and re-seeded from the headers of every response.
+    """
+
+    def __init__(self, limit: int, remaining: int, reset: float):
+        """
+
+        Args:
+            limit: calls allowed per window
+            remaining: calls left in the current window
+            reset: epoch time the current window resets at
+        """
+        self.limit = limit
+        self.remaining = remaining
+        self.reset = reset
+
+    def refill(self, now: float) -> None:
+        if now >= self.reset:
+            self.remaining = self.limit
+            self.reset = now + Settings.rate_limit_window
+
+    def take(self) -> None:
+        self.remaining = max(self.remaining - 1, 0)
+
+
+class RateLimitPlanner:
+    """
+    Client-side view of the Twitter rate limits, one TokenBucket per endpoint.
+
+    Buckets are seeded from the x-rate-limit-* headers of the responses.
+    Calls on an empty bucket wait for its window to reset, and the scheduler
+    asks wait_time() before starting a job: a job only starts while every
+    endpoint it uses keeps the reserve of its priority, so low priority jobs
+    (give_love) leave calls to the searches and retweets of the other jobs.
+    """
+
+    def __init__(self):
+        self._buckets = {}
+        self._lock = threading.Lock()
+        self.calls = {}
+        self.waits = 0
+        self.waited = 0.0
+        self.deferred = 0
+
+    def observe(self, response, *args, **kwargs) -> None:
+        """
+        requests response hook: seed the bucket of the endpoint from the headers.
+        """
+        headers = response.headers
+        if "x-rate-limit-limit" not in headers:
+            return
+        try:
+            limit = int(headers["x-rate-limit-limit"])
+            remaining = int(headers["x-rate-limit-remaining"])
+            reset = float(headers["x-rate-limit-reset"])
+        except (KeyError, ValueError):
+            return
+        resource = resource_of(response.url)
+        with self._lock:
+            bucket = self._buckets.get(resource)
+            if bucket is None:
+                self._buckets[resource] = TokenBucket(limit, remaining, reset)
+            else:
+                # responses of concurrent calls may arrive out of order
+                if reset == bucket.reset:
+                    remaining = min(bucket.remaining, remaining)
+                bucket.limit = limit
+                bucket.remaining = remaining
+                bucket.reset = reset
+
+    def _bucket(self, method: str):
+        bucket = self._buckets.get(RESOURCES.get(method))
+        if bucket is not None:
+            bucket.refill(time.time())
+        return bucket
+
+    def acquire(self, method: str) -> None:
+        """
+        Take a token for a call, waiting for the window to reset if there is none.
+
+        Args:
+            method: tweepy API method about to be called
+
+        Returns: None
+
+        """
+        with self._lock:
+            self.calls[method] = self.calls.get(method, 0) + 1
+            bucket = self._bucket(method)
+            if bucket is None:
+                return
+            wait = bucket.reset - time.time() + 1 if bucket.remaining <= 0 else 0
+            if wait <= 0:
+                bucket.take()
+                return
+            self.waits += 1
+            self.waited += wait
+
+        logger.warning(f"rate limit of {method} reached, waiting {wait:.0f} s")
+        time.sleep(wait)
+        with self._lock:
+            bucket = self._bucket(method)
+            bucket.take()
+
+    def headroom(self, method: str, job: str):
+        """
+        Args:
+            method: tweepy API method
+            job: name of the job making the calls
+
+        Returns: calls left above the reserve of the job priority, None if
+            the limit of the endpoint is not known yet
+
+        """
+        with self._lock:
+            bucket = self._bucket(method)
+            if bucket is None:
+                return None
+            reserve = Settings.rate_limit_reserve[self.priority(job)] * bucket.limit
+            return max(int(bucket.remaining - reserve), 0)
+
+    def wait_time(self, job: str) -> float:
+        """
+        Args:
+            job: job name, as in Settings.job_endpoints
+
+        Returns: seconds until every endpoint of the job is above the
+            reserve of its priority, 0 if the job can start now
+
+        """
+        methods = Settings.job_endpoints.get(job) or Settings.job_endpoints.get(
+            job.split(":")[0], ()
+        )
+        wait = 0.0
+        for method in methods:
+            headroom = self.headroom(method, job)
+            if headroom is not None and headroom <= 0:
+                with self._lock:
+                    bucket = self._bucket(method)
+                    wait = max(wait, bucket.reset - time.time() + 1)
+        return wait
+
+    @staticmethod
+    def priority(job: str) -> str:
+        """
+        Returns: priority of a job, `normal` if not listed on Settings.job_priority
+
+        """
+        return (
+            Settings.job_priority.get(job)
+            or Settings.job_priority.get(job.split(":")[0])
+            or "normal"
+        )
+
+    def stats(self) -> dict:
+        """
+        Returns: budget use of every endpoint seen so far, and the waits and
+            deferred jobs caused by the limits
+
+        """
+        now = time.time()
+        with self._lock:
+            endpoints = {}
+            for resource, bucket in self._buckets.items():
+                bucket.refill(now)
+                endpoints[resource] = {
+                    "limit": bucket.limit,
+                    "remaining": bucket.remaining,
+                    "reset_in": max(round(bucket.reset - now), 0),
+                }
+            return {
+                "endpoints": endpoints,
+                "calls": dict(self.calls),
+                "waits": self.waits,
+                "waited_seconds": round(self.waited),
+                "deferred_jobs": self.deferred,
+            }
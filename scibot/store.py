@@ -0,0 +1,610 @@
+import atexit
+import hashlib
+import json
+import math
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from scibot.tools import logger, Settings
+
+# kinds of tweet interactions kept in the store
+RETWEETED = "retweet"
+FAVED = "fav"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS publications (
+    article_id TEXT PRIMARY KEY,
+    tweet_id INTEGER,
+    count INTEGER NOT NULL DEFAULT 1
+);
+CREATE INDEX IF NOT EXISTS publications_count ON publications (count, tweet_id);
+CREATE TABLE IF NOT EXISTS interactions (
+    kind TEXT NOT NULL,
+    tweet_id TEXT NOT NULL,
+    PRIMARY KEY (kind, tweet_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS users (
+    user_id TEXT PRIMARY KEY,
+    follower INTEGER NOT NULL DEFAULT 0,
+    interactions INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS cursors (
+    source TEXT PRIMARY KEY,
+    since_id INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+
+class SqliteStateStore:
+    """
+    Bot state (posted articles, retweets, favs and users) kept in SQLite.
+
+    Every lookup is an indexed query and every update touches a single row,
+    the database runs in WAL mode so readers never wait on the writer. The
+    connection is shared between threads, access is serialized by a lock.
+    """
+
+    def __init__(self, path: str):
+        """
+
+        Args:
+            path: Full path to the database file, or ":memory:"
+        """
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        self._conn.commit()
+
+    @contextmanager
+    def transaction(self):
+        """
+        Run several updates atomically, commit on success and roll back on error.
+        """
+        with self._lock:
+            try:
+                yield self._conn
+                self._conn.commit()
+            except Exception:
+                self._conn.rollback()
+                raise
+
+    def _query(self, sql: str, params: tuple = ()) -> list:
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    # posted articles
+
+    def is_posted(self, article_id: str) -> bool:
+        return bool(
+            self._query("SELECT 1 FROM publications WHERE article_id = ?", (article_id,))
+        )
+
+    def add_publication(self, article_id: str, tweet_id: int, count: int = 1) -> None:
+        with self.transaction() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO publications (article_id, tweet_id, count) "
+                "VALUES (?, ?, ?)",
+                (article_id, tweet_id, count),
+            )
+
+    def least_retweeted_publications(self) -> list:
+        """
+        Publications retweeted the fewest times, oldest tweet first.
+
+        Returns: list of (article_id, tweet_id, count) tuples
+
+        """
+        return self._query(
+            "SELECT article_id, tweet_id, count FROM publications "
+            "WHERE count = (SELECT MIN(count) FROM publications) ORDER BY tweet_id"
+        )
+
+    def increment_publication_count(self, article_id: str) -> None:
+        with self.transaction() as conn:
+            conn.execute(
+                "UPDATE publications SET count = count + 1 WHERE article_id = ?",
+                (article_id,),
+            )
+
+    # retweeted and faved tweets
+
+    def has_interaction(self, kind: str, tweet_id: str) -> bool:
+        return bool(
+            self._query(
+                "SELECT 1 FROM interactions WHERE kind = ? AND tweet_id = ?",
+                (kind, tweet_id),
+            )
+        )
+
+    def add_interaction(self, kind: str, tweet_id: str) -> None:
+        self.add_interactions(kind, [tweet_id])
+
+    def add_interactions(self, kind: str, tweet_ids: list) -> None:
+        with self.transaction() as conn:
+            conn.executemany(
+                "INSERT OR IGNORE INTO interactions (kind, tweet_id) VALUES (?, ?)",
+                [(kind, x) for x in tweet_ids],
+            )
+
+    def interaction_ids(self, kind: str):
+        """
+        Iterate over the tweet ids of one kind of interaction, in chunks.
+        """
+        last_id = ""
+        while True:
+            rows = self._query(
+                "SELECT tweet_id FROM interactions WHERE kind = ? AND tweet_id > ? "
+                "ORDER BY tweet_id LIMIT 10000",
+                (kind, last_id),
+            )
+            if not rows:
+                return
+            for row in rows:
+                yield row[0]
+            last_id = rows[-1][0]
+
+    # users
+
+    def get_user(self, user_id: str) -> dict:
+        rows = self._query(
+            "SELECT follower, interactions FROM users WHERE user_id = ?", (user_id,)
+        )
+        if not rows:
+            return None
+        return {"follower": bool(rows[0][0]), "interactions": rows[0][1]}
+
+    def add_user_interaction(self, user_id: str) -> None:
+        with self.transaction() as conn:
+            conn.execute(
+                "INSERT INTO users (user_id, follower, interactions) VALUES (?, 0, 1) "
+                "ON CONFLICT (user_id) DO UPDATE SET interactions = interactions + 1",
+                (user_id,),
+            )
+
+    def add_follower(self, user_id: str) -> None:
+        with self.transaction() as conn:
+            conn.execute(
+                "INSERT INTO users (user_id, follower, interactions) VALUES (?, 1, 1) "
+                "ON CONFLICT (user_id) DO UPDATE SET follower = 1",
+                (user_id,),
+            )
+
+    def users(self) -> list:
+        """
+        Returns: (user_id, follower, interactions) of every user
+        """
+        return [
+            (user_id, bool(follower), interactions)
+            for user_id, follower, interactions in self._query(
+                "SELECT user_id, follower, interactions FROM users"
+            )
+        ]
+
+    def data_version(self) -> int:
+        """
+        Returns: counter changing whenever another connection commits a change
+        """
+        return self._query("PRAGMA data_version")[0][0]
+
+    def followers(self) -> list:
+        return [x[0] for x in self._query("SELECT user_id FROM users WHERE follower = 1")]
+
+    def mean_non_follower_interactions(self) -> float:
+        """
+        Returns: mean interaction count of users not following us, None if there are none
+
+        """
+        return self._query("SELECT AVG(interactions) FROM users WHERE follower = 0")[0][0]
+
+    # polling cursors
+
+    def get_cursor(self, source: str) -> int:
+        rows = self._query("SELECT since_id FROM cursors WHERE source = ?", (source,))
+        return rows[0][0] if rows else None
+
+    def set_cursor(self, source: str, since_id: int) -> None:
+        with self.transaction() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO cursors (source, since_id) VALUES (?, ?)",
+                (source, since_id),
+            )
+
+    # migration
+
+    def get_meta(self, key: str) -> str:
+        rows = self._query("SELECT value FROM meta WHERE key = ?", (key,))
+        return rows[0][0] if rows else None
+
+    def set_meta(self, key: str, value: str) -> None:
+        with self.transaction() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value)
+            )
+
+    def migrate_json(
+        self,
+        posted_urls_file: str,
+        posted_retweets_file: str,
+        faved_tweets_file: str,
+        users_file: str,
+    ) -> None:
+        """
+        One-shot import of the json log files used by earlier versions.
+
+        Args:
+            posted_urls_file: publications json file
+            posted_retweets_file: retweeted tweets json file
+            faved_tweets_file: faved tweets json file
+            users_file: users interactions json file
+
+        Returns: None
+
+        """
+        with self.transaction() as conn:
+            for article_id, value in _read_json(posted_urls_file).items():
+                if "tweet_id" in value:
+                    conn.execute(
+                        "INSERT OR IGNORE INTO publications (article_id, tweet_id, count) "
+                        "VALUES (?, ?, ?)",
+                        (article_id, value["tweet_id"], value.get("count", 1)),
+                    )
+            for kind, filename in (
+                (RETWEETED, posted_retweets_file),
+                (FAVED, faved_tweets_file),
+            ):
+                conn.executemany(
+                    "INSERT OR IGNORE INTO interactions (kind, tweet_id) VALUES (?, ?)",
+                    [(kind, x) for x in _read_json(filename) if x != "test"],
+                )
+            conn.executemany(
+                "INSERT OR IGNORE INTO users (user_id, follower, interactions) "
+                "VALUES (?, ?, ?)",
+                [
+                    (user_id, int(value["follower"]), value["interactions"])
+                    for user_id, value in _read_json(users_file).items()
+                    if user_id != "test"
+                ],
+            )
+            conn.execute(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES ('json_migrated', '1')"
+            )
+
+
+def _read_json(filename: str) -> dict:
+    if not os.path.isfile(filename):
+        return {}
+    with open(filename, "r") as json_file:
+        return json.load(json_file)
+
+
+class BloomFilter:
+    """
+    Fixed size set of strings answering "maybe seen" or "never seen".
+    """
+
+    def __init__(self, capacity: int, error_rate: float):
+        """
+
+        Args:
+            capacity: number of keys the filter is sized for
+            error_rate: false positive probability at capacity
+        """
+        self.capacity = capacity
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.count = 0
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, key: str):
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hashes))
+
+    def add(self, key: str) -> None:
+        for pos in self._positions(key):
+            self._bits[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+
+    def __contains__(self, key: str) -> bool:
+        return all(self._bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(key))
+
+
+class SeenIndex:
+    """
+    Process-wide index of the tweet ids already retweeted or faved.
+
+    The ids are read from the state store once and answered from memory: a
+    hash set while there are fewer than Settings.seen_index_max_ids, a Bloom
+    filter confirmed against the store above that, so memory stays bounded.
+    New ids are written behind, in one batch every `flush_interval` seconds,
+    a crash loses at most the ids of one interval.
+    """
+
+    def __init__(self, store, kind: str, flush_interval: float, max_ids: int):
+        """
+
+        Args:
+            store: state store holding the interactions
+            kind: kind of interaction indexed (RETWEETED or FAVED)
+            flush_interval: seconds between writes of new ids to the store
+            max_ids: largest number of ids kept in an exact set
+        """
+        self.store = store
+        self.kind = kind
+        self.flush_interval = flush_interval
+        self.max_ids = max_ids
+        self._lock = threading.Lock()
+        self._pending = set()
+        self._ids = set()
+        self._bloom = None
+        self._flusher = None
+
+        for tweet_id in store.interaction_ids(kind):
+            self._index(tweet_id)
+        atexit.register(self.flush)
+
+    def _index(self, tweet_id: str) -> None:
+        if self._bloom is not None:
+            if self._bloom.count >= self._bloom.capacity:
+                self._rebuild_bloom(self._bloom.count * 2)
+            self._bloom.add(tweet_id)
+            return
+        self._ids.add(tweet_id)
+        if len(self._ids) > self.max_ids:
+            self._rebuild_bloom(self.max_ids * 4)
+
+    def _rebuild_bloom(self, capacity: int) -> None:
+        ids = self._ids or set(self.store.interaction_ids(self.kind)) | self._pending
+        self._bloom = BloomFilter(capacity, Settings.seen_bloom_error_rate)
+        for tweet_id in ids:
+            self._bloom.add(tweet_id)
+        self._ids = None
+
+    def __contains__(self, tweet_id: str) -> bool:
+        with self._lock:
+            if tweet_id in self._pending:
+                return True
+            if self._bloom is None:
+                return tweet_id in self._ids
+            if tweet_id not in self._bloom:
+                return False
+        return self.store.has_interaction(self.kind, tweet_id)
+
+    def add(self, tweet_id: str) -> None:
+        with self._lock:
+            if tweet_id in self._pending:
+                return
+            self._pending.add(tweet_id)
+            self._index(tweet_id)
+            if self._flusher is None:
+                self._flusher = threading.Thread(
+                    target=self._flush_loop, name=f"seen-{self.kind}", daemon=True
+                )
+                self._flusher.start()
+
+    def flush(self) -> None:
+        """
+        Write the ids added since the last flush to the store.
+        """
+        # written under the lock, so an id is never out of _pending before it
+        # is in the store, and stays pending if the write fails
+        with self._lock:
+            if not self._pending:
+                return
+            try:
+                self.store.add_interactions(self.kind, self._pending)
+            except sqlite3.Error as e:
+                logger.exception(e)
+                return
+            self._pending = set()
+
+    def _flush_loop(self) -> None:
+        while True:
+            time.sleep(self.flush_interval)
+            self.flush()
+
+
+class UserIndex:
+    """
+    Process-wide index of the interaction counts of the users.
+
+    Users are read from the state store once, the sum and number of the
+    interaction counts of non-followers are kept up to date on every change,
+    so the mean used by check_interactions costs no scan. Changes are
+    written through to the store, and sync() reloads the users only when
+    another process changed the store.
+
+    Followers are kept in a hash set, followers() hands out a frozen copy
+    that is only rebuilt after the followers changed.
+    """
+
+    def __init__(self, store):
+        """
+
+        Args:
+            store: state store holding the users
+        """
+        self.store = store
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self) -> None:
+        self._version = self.store.data_version()
+        self._interactions = {}
+        self._followers = set()
+        self._snapshot = None
+        self._non_follower_sum = 0
+        self._non_follower_count = 0
+        for user_id, follower, interactions in self.store.users():
+            self._interactions[user_id] = interactions
+            if follower:
+                self._followers.add(user_id)
+            else:
+                self._non_follower_sum += interactions
+                self._non_follower_count += 1
+
+    def sync(self) -> None:
+        """
+        Reload the users if another process changed the store since the last load.
+        """
+        with self._lock:
+            if self.store.data_version() != self._version:
+                logger.debug("users changed by another process, reloading")
+                self._load()
+
+    def followers(self) -> frozenset:
+        """
+        Returns: ids of the users following us
+        """
+        with self._lock:
+            if self._snapshot is None:
+                self._snapshot = frozenset(self._followers)
+            return self._snapshot
+
+    def is_follower(self, user_id: str) -> bool:
+        with self._lock:
+            return user_id in self._followers
+
+    def get(self, user_id: str) -> dict:
+        """
+        Returns: follower flag and interaction count of a user, None if unknown
+
+        """
+        with self._lock:
+            interactions = self._interactions.get(user_id)
+            if interactions is None:
+                return None
+            return {"follower": user_id in self._followers, "interactions": interactions}
+
+    def mean_non_follower_interactions(self) -> float:
+        """
+        Returns: mean interaction count of users not following us, None if there are none
+
+        """
+        with self._lock:
+            if not self._non_follower_count:
+                return None
+            return self._non_follower_sum / self._non_follower_count
+
+    def add_interaction(self, user_id: str) -> None:
+        """
+        Count one more interaction with a user, adding the user if new.
+        """
+        self.store.add_user_interaction(user_id)
+        with self._lock:
+            if user_id not in self._interactions:
+                self._interactions[user_id] = 1
+                self._non_follower_count += 1
+                self._non_follower_sum += 1
+                return
+            self._interactions[user_id] += 1
+            if user_id not in self._followers:
+                self._non_follower_sum += 1
+
+    def add_follower(self, user_id: str) -> None:
+        """
+        Mark a user as follower, adding the user if new.
+        """
+        self.store.add_follower(user_id)
+        with self._lock:
+            if user_id in self._followers:
+                return
+            if user_id not in self._interactions:
+                self._interactions[user_id] = 1
+            else:
+                self._non_follower_sum -= self._interactions[user_id]
+                self._non_follower_count -= 1
+            self._followers.add(user_id)
+            self._snapshot = None
+
+
+STATE_BACKENDS = {
+    "sqlite": SqliteStateStore,
+}
+
+_state_store = None
+_state_store_lock = threading.Lock()
+
+
+def get_state_store():
+    """
+    Open the state store selected on Settings.state_backend, once per process.
+
+    The json files of earlier versions are migrated the first time the store
+    is opened.
+
+    Returns: state store shared by all jobs
+
+    """
+    global _state_store
+    with _state_store_lock:
+        if _state_store is None:
+            store = STATE_BACKENDS[Settings.state_backend](Settings.state_db_file)
+            if store.get_meta("json_migrated") is None:
+                logger.info("migrating json log files to the state store")
+                store.migrate_json(
+                    Settings.posted_urls_output_file,
+                    Settings.posted_retweets_output_file,
+                    Settings.faved_tweets_output_file,
+                    Settings.users_json_file,
+                )
+            _state_store = store
+        return _state_store
+
+
+_seen_indexes = {}
+
+
+def get_seen_index(kind: str) -> SeenIndex:
+    """
+    Seen-id index of one kind of interaction, loaded once per process.
+
+    Args:
+        kind: RETWEETED or FAVED
+
+    Returns: SeenIndex shared by all jobs
+
+    """
+    with _state_store_lock:
+        index = _seen_indexes.get(kind)
+    if index is None:
+        store = get_state_store()
+        with _state_store_lock:
+            if kind not in _seen_indexes:
+                _seen_indexes[kind] = SeenIndex(
+                    store, kind, Settings.seen_flush_seconds, Settings.seen_index_max_ids
+                )
+            index = _seen_indexes[kind]
+    return index
+
+
+_user_index = None
+
+
+def get_user_index() -> UserIndex:
+    """
+    Interaction counts of the users, loaded once per process.
+
+    Returns: UserIndex shared by all jobs
+
+    """
+    global _user_index
+    if _user_index is None:
+        store = get_state_store()
+        with _state_store_lock:
+            if _user_index is None:
+                _user_index = UserIndex(store)
+    return _user_index
@@ -1,26 +1,172 @@
+import atexit
+import logging
+import queue
+import threading
+import time
+
 import requests
 import os
 from os.path import expanduser
 from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from scibot.metrics import metrics
 
 env_path = expanduser("~/.env")
 load_dotenv(dotenv_path=env_path)
 
+logger = logging.getLogger("bot logger")
 
-def telegram_bot_sendtext(bot_message):
 
-    token = os.getenv("API_TOKEN")
-    bot_id = os.getenv("BOT_ID")
+class TelegramNotifier:
+    """
+    Send Telegram messages from a background thread.
+
+    Messages are queued and return right away, the worker sends the ones
+    arriving within `batch_window` seconds of each other as one message,
+    over a keep-alive session with timeouts and retries. When the queue is
+    full new messages are dropped and counted in the next message sent.
+    """
+
+    url = "https://api.telegram.org/bot{token}/sendMessage"
+    max_length = 4096  # Telegram message limit
+
+    def __init__(
+        self,
+        batch_window: float = 2.0,
+        maxsize: int = 1000,
+        timeout: tuple = (5, 15),
+        retries: int = 3,
+    ):
+        """
+
+        Args:
+            batch_window: seconds to wait for more messages before sending
+            maxsize: messages kept in the queue
+            timeout: connect and read timeouts of a request
+            retries: retries of a request failing on connection or server errors
+        """
+        self.batch_window = batch_window
+        self.timeout = timeout
+        self.retries = retries
+        self.sent = 0
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize)
+        self._session = None
+        self._worker = None
+        self._lock = threading.Lock()
+
+    def send(self, bot_message: str) -> None:
+        """
+        Queue a message, never blocks.
+        """
+        if self._worker is None:
+            self._start()
+        try:
+            self._queue.put_nowait(str(bot_message))
+        except queue.Full:
+            self.dropped += 1
+
+    def flush(self, timeout: float = 10) -> None:
+        """
+        Wait until the queued messages are sent, at most `timeout` seconds.
+        """
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.05)
+
+    def _start(self) -> None:
+        with self._lock:
+            if self._worker is None:
+                self._worker = threading.Thread(
+                    target=self._run, name="scibot-telegram", daemon=True
+                )
+                self._worker.start()
+                atexit.register(self.flush)
+
+    def _run(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.batch_window
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            try:
+                for text in self._pack(batch):
+                    self._post(text)
+            except Exception as e:
+                logger.warning(f"telegram notification failed: {e}")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _pack(self, batch: list) -> list:
+        if self.dropped:
+            batch = batch + [f"({self.dropped} notifications dropped)"]
+            self.dropped = 0
+        texts = [""]
+        for message in batch:
+            message = message[: self.max_length]
+            if texts[-1] and len(texts[-1]) + 2 + len(message) > self.max_length:
+                texts.append("")
+            texts[-1] = f"{texts[-1]}\n\n{message}" if texts[-1] else message
+        return texts
+
+    def _post(self, text: str) -> None:
+        if self._session is None:
+            self._session = requests.Session()
+            self._session.mount(
+                "https://",
+                HTTPAdapter(
+                    max_retries=Retry(
+                        total=self.retries,
+                        backoff_factor=1,
+                        status_forcelist=(429, 500, 502, 503, 504),
+                    )
+                ),
+            )
+        url = self.url.format(token=os.getenv("API_TOKEN"))
+        params = {"chat_id": os.getenv("BOT_ID"), "text": text}
+        with metrics.span("telegram_call_seconds"):
+            response = self._session.get(
+                url, params={**params, "parse_mode": "Markdown"}, timeout=self.timeout
+            )
+            if response.status_code == 400:
+                # joined messages may not be valid markdown together
+                response = self._session.get(url, params=params, timeout=self.timeout)
+            response.raise_for_status()
+        self.sent += 1
+
+    def metric_samples(self) -> list:
+        """
+        Returns: (name, labels, value) samples of the notification queue
+
+        """
+        return [
+            ("telegram_sent_total", {}, self.sent),
+            ("telegram_dropped", {}, self.dropped),
+            ("telegram_queued", {}, self._queue.qsize()),
+        ]
+
+
+notifier = TelegramNotifier()
+metrics.add_collector(notifier.metric_samples)
+
+
+def telegram_bot_sendtext(bot_message):
+    """
+    Queue a Telegram notification, it is sent in the background.
 
-    send_text = (
-        "https://api.telegram.org/bot"
-        + token
-        + "/sendMessage?chat_id="
-        + bot_id
-        + "&parse_mode=Markdown&text="
-        + bot_message
-    )
+    Args:
+        bot_message: text of the notification
 
-    response = requests.get(send_text)
+    Returns: None
 
-    return response.json()
+    """
+    notifier.send(bot_message)
@@ -1,19 +1,24 @@
 import logging
-import json
-import re
-import os
+import heapq
+import itertools
+import random
+import threading
 import time
 import datetime
-import feedparser
-import dateutil.parser
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
 from os.path import expanduser
+from scibot.cron import CronExpression
+from scibot.matcher import compile_hashtag_inserter
+from scibot.metrics import metrics
 from scibot.telebot import telegram_bot_sendtext
-from schedule import Scheduler
+from schedule import CancelJob, Job, Scheduler
 
 # logging parameters
 logger = logging.getLogger("bot logger")
-# handler determines where the logs go: stdout/file
-file_handler = logging.FileHandler(f"{datetime.date.today()}_scibot.log")
+# handler determines where the logs go: stdout/file, the file is only
+# created once something is logged
+file_handler = logging.FileHandler(f"{datetime.date.today()}_scibot.log", delay=True)
 
 logger.setLevel(logging.DEBUG)
 file_handler.setLevel(logging.DEBUG)
@@ -43,14 +48,120 @@ class Settings:
         "https://pubmed.ncbi.nlm.nih.gov/rss/search/1hEma6JdH30sOOO0DiTP1jZh-6ZgoypoEsw_B9tXZejk_E8QuX/?limit=100&utm_campaign=pubmed-2&fc=20210510230918",
     ]
 
-    pre_combined_feed = [feedparser.parse(url)["entries"] for url in feed_urls]
-
-    # (combined_feed)
+    # Seconds a downloaded feed is reused before it is fetched again.
+    feed_cache_ttl = 60 * 60
+
+    # Minutes between background feed refreshes while running scheduled jobs.
+    feed_refresh_minutes = 30
+
+    # Feeds downloaded in parallel, and the download timeout in seconds.
+    feed_fetch_workers = 5
+    feed_fetch_timeout = 30
+
+    # Cache file with the ETag/Last-Modified headers and items of every feed.
+    feed_cache_file = expanduser("~/drugscibot/feed-cache.json")
+
+    # Feed entries whose parsed abstract, DOI link and authors are kept.
+    article_cache_size = 1000
+
+    # Twitter client connection pool and (connect, read) timeouts in seconds.
+    twitter_pool_connections = 4
+    twitter_pool_size = 8
+    twitter_timeout = (10, 60)
+
+    # Twitter response caches: kind -> (ttl in seconds, max entries).
+    twitter_cache = {
+        "status": (10 * 60, 5000),
+        "retweets": (15 * 60, 1000),
+        "list_timeline": (60, 20),
+    }
+
+    # Most pages fetched per poll to catch up with tweets since the last poll.
+    poll_max_pages = 5
+    # Pacing of the posts: seconds between the tweets of a thread, and
+    # range of the random delay in seconds before a fav.
+    thread_reply_delay = 2
+    fav_delay = (0, 250)
+
+    # Async search pipeline (--async): API calls in flight at once and calls
+    # allowed per cycle.
+    async_concurrency = 8
+    async_call_budget = 60
+
+    # Ranking of the search candidates: how many are kept, the weights of
+    # their score (retweets, favs, keywords matched, log10 of the author
+    # followers), how many of the best ranked ones get their retweeters
+    # prefetched (statuses/retweets allows 75 calls per 15 minutes, the act
+    # stage mostly stops at the first candidates) and the threads doing it.
+    candidate_top_k = 10
+    candidate_weights = {"retweets": 2.0, "favorites": 1.0, "keywords": 1.0, "reach": 0.5}
+    candidate_prefetch = 3
+    candidate_prefetch_workers = 4
+
+    # Jobs of `scibot sch`: (cron expression, job, arguments, jitter). The
+    # cron fields are minute, hour, day of month, month and day of week,
+    # see scibot.cron.CronExpression. Every run starts up to `jitter`
+    # seconds after its time, at random, so jobs due at the same minute do
+    # not hit the API at once.
+    job_schedule = [
+        ("20 6,14,22 * * *", "read_rss_and_tweet", (), 120),
+        ("10 1,9,17 * * *", "retweet_old_own", (), 300),
+        ("20 */3 * * *", "search_and_retweet", ("list_search",), 300),
+        ("25 1-22/3 * * *", "search_and_retweet", ("list_search",), 300),
+        ("*/5 * * * *", "search_and_retweet", ("give_love",), 60),
+    ]
 
-    combined_feed = [item for feed in pre_combined_feed for item in feed]
-    combined_feed.sort(
-        key=lambda x: dateutil.parser.parse(x["published"]), reverse=True
-    )
+    # Threads running scheduled jobs, and how many runs of a job may overlap:
+    # job name (or name:first argument) -> (max concurrent runs, policy),
+    # policy "skip" drops a run while the limit is reached, "queue" waits.
+    scheduler_workers = 4
+    job_limits = {
+        "read_rss_and_tweet": (1, "skip"),
+        "retweet_old_own": (1, "skip"),
+        "search_and_retweet:list_search": (1, "skip"),
+        "search_and_retweet:give_love": (1, "skip"),
+    }
+
+    # Rate limit planning: length of a Twitter rate limit window, share of
+    # every endpoint limit kept back from the jobs of each priority, job
+    # priorities and the tweepy API methods each job calls.
+    rate_limit_window = 15 * 60
+    rate_limit_reserve = {"normal": 0.1, "low": 0.4}
+    job_priority = {"search_and_retweet:give_love": "low"}
+    job_endpoints = {
+        "retweet_old_own": ("statuses_lookup",),
+        "search_and_retweet:global_search": ("search", "retweets"),
+        "search_and_retweet:list_search": ("list_timeline", "retweets"),
+        "search_and_retweet:give_love": ("list_timeline", "search"),
+    }
+
+    # Metrics of the scheduled jobs: local port of the Prometheus endpoint
+    # (None to disable), json file the metrics are dumped to and minutes
+    # between dumps.
+    metrics_port = 9464
+    metrics_dump_file = expanduser("~/drugscibot/metrics.json")
+    metrics_dump_minutes = 5
+
+    # Profiling with --profile or SCIBOT_PROFILE: default mode ("cprofile"
+    # or the cheaper "sample"), folder of the profiles and seconds between
+    # stack samples.
+    profile_mode = "cprofile"
+    profile_dir = expanduser("~/drugscibot/profiles")
+    profile_interval = 0.005
+
+    # Storage backend for posted articles, retweets, favs and users, see
+    # scibot.store.STATE_BACKENDS.
+    state_backend = "sqlite"
+    state_db_file = expanduser("~/drugscibot/scibot.db")
+
+    # Seconds between writes of newly retweeted/faved ids to the state store,
+    # ids kept in an exact set before switching to a Bloom filter, and the
+    # filter false positive rate.
+    seen_flush_seconds = 30
+    seen_index_max_ids = 500000
+    seen_bloom_error_rate = 0.001
+
+    # Json log files of earlier versions, migrated once into the state store.
 
     # Log file to save all tweeted RSS links (one URL per line).
     posted_urls_output_file = expanduser("~/drugscibot/publications.json")
@@ -159,6 +270,85 @@ class Settings:
     mylist_id = "1306244304000749569"
 
 
+class HeapJob(Job):
+    """
+    A schedule.Job reporting every new run time to its scheduler heap.
+    """
+
+    # name the scheduler knows the job by, the function name if None
+    name = None
+
+    def _schedule_next_run(self):
+        super()._schedule_next_run()
+        self.scheduler.push(self)
+
+
+class OnceJob(HeapJob):
+    """
+    A job run a single time, `seconds` after it is scheduled. The scheduler
+    drops it when dispatching it, so it can never come due again.
+    """
+
+    def __init__(self, seconds: float, scheduler=None):
+        """
+
+        Args:
+            seconds: delay before the run, at least one second
+            scheduler: SafeScheduler to register with
+        """
+        super().__init__(1, scheduler)
+        self.delay = max(seconds, 1)
+        self.unit = "once"
+
+    def __repr__(self):
+        return (
+            f"OnceJob({self.delay}, "
+            f"do={getattr(self.job_func, '__name__', self.job_func)}, "
+            f"next_run={self.next_run})"
+        )
+
+    def _schedule_next_run(self):
+        self.next_run = datetime.datetime.now() + datetime.timedelta(seconds=self.delay)
+        self.scheduler.push(self)
+
+
+class CronJob(HeapJob):
+    """
+    A job due at the times of a cron expression, each run delayed by a
+    random jitter of up to `jitter` seconds.
+    """
+
+    def __init__(self, expression: str, jitter: float = 0, scheduler=None):
+        """
+
+        Args:
+            expression: cron expression, see scibot.cron.CronExpression
+            jitter: most seconds a run is delayed
+            scheduler: SafeScheduler to register with
+        """
+        super().__init__(1, scheduler)
+        self.cron = CronExpression(expression)
+        self.jitter = jitter
+        self.unit = "cron"
+        self._due = None
+
+    def __repr__(self):
+        return (
+            f"CronJob({self.cron.expression!r}, jitter={self.jitter}, "
+            f"do={getattr(self.job_func, '__name__', self.job_func)}, "
+            f"next_run={self.next_run})"
+        )
+
+    def _schedule_next_run(self):
+        # count from the cron time, not the jittered one, so runs never drift
+        now = datetime.datetime.now()
+        self._due = self.cron.next_after(max(now, self._due or now))
+        self.next_run = self._due + datetime.timedelta(
+            seconds=random.uniform(0, self.jitter)
+        )
+        self.scheduler.push(self)
+
+
 class SafeScheduler(Scheduler):
     """
     An implementation of Scheduler that catches jobs that fail, logs their
@@ -166,28 +356,270 @@ class SafeScheduler(Scheduler):
     next run time, and keeps going.
     Use this to run jobs that may or may not crash without worrying about
     whether other jobs will run or if they'll crash the entire script.
+
+    Jobs run on a pool of worker threads, so a job sleeping or waiting on a
+    rate limit does not hold back the others. Settings.job_limits caps how
+    many runs of the same job may overlap.
+
+    Run times are kept in a heap: run_pending only looks at the jobs due,
+    and run_forever sleeps until the next one instead of polling.
     """
 
-    def __init__(self, reschedule_on_failure=True):
+    # seconds run_forever waits when a job is due but nothing was dispatched
+    min_wait = 0.1
+
+    def __init__(
+        self,
+        reschedule_on_failure=True,
+        max_workers=None,
+        job_limits=None,
+        rate_limits=None,
+        profiler=None,
+    ):
         """
 
         Args:
             reschedule_on_failure: if is True, jobs will be rescheduled for their
         next run as if they had completed successfully. If False, they'll run
         on the next run_pending() tick.
+            max_workers: number of worker threads, Settings.scheduler_workers by default
+            job_limits: overlap limits per job, Settings.job_limits by default
+            rate_limits: RateLimitPlanner asked before starting a job, a job
+        short of API calls is deferred until its rate limit window resets
+            profiler: scibot.profiling.Profiler profiling every job run, if any
         """
         self.reschedule_on_failure = reschedule_on_failure
+        self.rate_limits = rate_limits
+        self.profiler = profiler
+        self.max_workers = max_workers or Settings.scheduler_workers
+        self.job_limits = Settings.job_limits if job_limits is None else job_limits
+        self._pool = ThreadPoolExecutor(
+            max_workers=self.max_workers, thread_name_prefix="scibot-job"
+        )
+        self._lock = threading.RLock()
+        self._slots = {}
+        self._heap = []
+        self._sequence = itertools.count()
+        self._wakeup = threading.Event()
         super().__init__()
 
+    def every(self, interval=1):
+        return HeapJob(interval, self)
+
+    def once(self, seconds: float, name: str = None) -> OnceJob:
+        """
+        Schedule a job running once, `seconds` from now.
+
+        Args:
+            seconds: delay before the run
+            name: name of the job for its limits, the function name by default
+
+        Returns: the job, to be completed with .do(job_func, *args)
+
+        """
+        job = OnceJob(seconds, self)
+        job.name = name
+        return job
+
+    def cron(self, expression: str, jitter: float = 0, name: str = None) -> CronJob:
+        """
+        Schedule a new job at the times of a cron expression.
+
+        Args:
+            expression: cron expression, see scibot.cron.CronExpression
+            jitter: most seconds a run is delayed, at random
+            name: name of the job for its limits, the function name by default
+
+        Returns: the job, to be completed with .do(job_func, *args)
+
+        """
+        job = CronJob(expression, jitter, self)
+        job.name = name
+        return job
+
+    def push(self, job) -> None:
+        """
+        Queue the next run of a job, waking up run_forever if it is due first.
+        """
+        with self._lock:
+            entry = (job.next_run, next(self._sequence), job)
+            heapq.heappush(self._heap, entry)
+            if self._heap[0] is entry:
+                self._wakeup.set()
+
+    def _is_current(self, entry) -> bool:
+        # entries of cancelled or rescheduled jobs are dropped when reached
+        next_run, _, job = entry
+        return job.next_run == next_run and job in self.jobs
+
+    @staticmethod
+    def job_name(job) -> str:
+        """
+        Returns: name of the job, or of its function, followed by its first
+            argument if any
+
+        """
+        func = job.job_func.func
+        name = job.name or getattr(func, "__name__", repr(func))
+        if job.job_func.args:
+            name += f":{job.job_func.args[0]}"
+        return name
+
+    def _limit(self, name: str) -> tuple:
+        limit = self.job_limits.get(name) or self.job_limits.get(name.split(":")[0])
+        return limit or (self.max_workers, "queue")
+
+    def run_pending(self) -> int:
+        """
+        Returns: number of jobs dispatched
+
+        """
+        now = datetime.datetime.now()
+        dispatched = 0
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now:
+                entry = heapq.heappop(self._heap)
+                if self._is_current(entry):
+                    self._run_job(entry[2])
+                    dispatched += 1
+        return dispatched
+
+    @property
+    def idle_seconds(self):
+        """
+        Returns: seconds until the next job is due, None without jobs
+
+        """
+        with self._lock:
+            while self._heap and not self._is_current(self._heap[0]):
+                heapq.heappop(self._heap)
+            if not self._heap:
+                return None
+            return (self._heap[0][0] - datetime.datetime.now()).total_seconds()
+
+    def run_forever(self) -> None:
+        """
+        Run the jobs as they come due, sleeping in between.
+        """
+        while True:
+            self._wakeup.clear()
+            dispatched = self.run_pending()
+            idle = self.idle_seconds
+            if idle is not None and idle <= 0 and not dispatched:
+                # something is due but nothing was dispatched: yield, do not spin
+                idle = self.min_wait
+            if idle is None or idle > 0:
+                self._wakeup.wait(idle)
+
+    def cancel_job(self, job):
+        with self._lock:
+            super().cancel_job(job)
+
     def _run_job(self, job):
+        name = self.job_name(job)
+        max_runs, policy = self._limit(name)
+        slots = self._slots.setdefault(name, threading.BoundedSemaphore(max_runs))
+
+        # plan the next run now, the job itself runs on a worker thread
+        job.last_run = datetime.datetime.now()
+        if isinstance(job, OnceJob):
+            # dispatched once, dropped before it can come due again
+            super().cancel_job(job)
+        else:
+            job._schedule_next_run()
+
+        wait = self.rate_limits.wait_time(name) if self.rate_limits else 0
+        if wait > 0:
+            # a one-shot run has no next run to wait for, it is deferred again
+            if not isinstance(job, OnceJob) and (
+                wait >= (job.next_run - job.last_run).total_seconds()
+            ):
+                logger.warning(f"skipped {name}, short of API calls until its next run")
+                metrics.inc("jobs_skipped_total", job=name, reason="rate_limit")
+            else:
+                logger.warning(f"deferred {name} by {wait:.0f} s, short of API calls")
+                metrics.inc("jobs_deferred_total", job=name)
+                self.rate_limits.deferred += 1
+                self._defer_run(wait, job)
+            return
+
+        if policy == "skip":
+            if not slots.acquire(blocking=False):
+                logger.warning(f"skipped {name}, {max_runs} run(s) still in progress")
+                metrics.inc("jobs_skipped_total", job=name, reason="overlap")
+                return
+            self._pool.submit(self._execute, job, name, slots)
+        else:
+            self._pool.submit(self._execute, job, name, slots, True)
+
+    def _execute(self, job, name, slots, wait_for_slot=False):
+        if wait_for_slot:
+            slots.acquire()
         try:
-            super()._run_job(job)
+            profiling = self.profiler.profile(name) if self.profiler else nullcontext()
+            with metrics.span("job_seconds", job=name), profiling:
+                ret = job.job_func()
+            if isinstance(ret, CancelJob) or ret is CancelJob:
+                self.cancel_job(job)
 
         except Exception as e:
             logger.exception(e)
-            telegram_bot_sendtext(f"[Job Error] {e}")
-            job.last_run = datetime.datetime.now()
-            job._schedule_next_run()
+            telegram_bot_sendtext(f"[Job Error] {name} {e}")
+            if not self.reschedule_on_failure:
+                job.next_run = datetime.datetime.now()
+                self.push(job)
+        finally:
+            slots.release()
+
+    def defer(self, seconds: float, func, *args, **kwargs) -> None:
+        """
+        Run a function once, `seconds` from now, as a scheduled continuation.
+
+        Args:
+            seconds: delay before running the function, at least one second
+            func: function to run
+            *args: positional arguments for func
+            **kwargs: keyword arguments for func
+
+        Returns: None
+
+        """
+        with self._lock:
+            self.once(seconds).do(func, *args, **kwargs)
+
+    def _defer_run(self, seconds: float, job) -> None:
+        # same function and arguments as the job, so its limits still apply
+        # a one-shot job, dropped when dispatched, so it never comes due again
+        self.once(seconds, job.name).do(
+            job.job_func.func, *job.job_func.args, **job.job_func.keywords
+        )
+
+
+# scheduler running the jobs of this process, if any
+active_scheduler = None
+
+
+def defer(seconds: float, func, *args, **kwargs):
+    """
+    Run a function after a delay without blocking a scheduler worker.
+
+    Under the scheduler the function becomes a continuation job, otherwise
+    (a single command run from the CLI) this sleeps and calls it right away.
+
+    Args:
+        seconds: delay before running the function
+        func: function to run
+        *args: positional arguments for func
+        **kwargs: keyword arguments for func
+
+    Returns: the result of func if it ran right away, else None
+
+    """
+    if active_scheduler is not None:
+        active_scheduler.defer(seconds, func, *args, **kwargs)
+        return None
+    time.sleep(seconds)
+    return func(*args, **kwargs)
 
 
 def shorten_text(text: str, maxlength: int) -> str:
@@ -215,23 +647,16 @@ def insert_hashtag(title: str) -> str:
 
     """
 
-    for x in Settings.add_hashtag:
-        if re.search(fr"\b{x}", title.lower()):
-            pos = (re.search(fr"\b{x}", title.lower())).start()
-            if " " in x:
-                title = title[:pos] + "#" + title[pos:].replace(" ", "", 1)
-            else:
-                title = title[:pos] + "#" + title[pos:]
-    return title
+    return compile_hashtag_inserter(tuple(Settings.add_hashtag)).insert(title)
 
 
-def compose_message(item: feedparser.FeedParserDict) -> str:
+def compose_message(item) -> str:
     """
     Compose a tweet from an RSS item (title, link, description)
     and return final tweet message.
 
     Args:
-        item: feedparser.FeedParserDict
+        item: Article or feedparser.FeedParserDict
         An RSS item
 
     Returns: mMssage suited for a Twitter status update.
@@ -243,74 +668,43 @@ def compose_message(item: feedparser.FeedParserDict) -> str:
     return message
 
 
-def is_in_logfile(content: str, filename: str) -> bool:
-    """
-    Does the content exist on any line in the log file?
-
-    Args:
-        content: Content to search file for.
-        filename: Full path to file to search.
-
-    Returns: `True` if content is found in file, otherwise `False`.
-
-    """
-    if os.path.isfile(filename):
-        with open(filename, "r") as jsonFile:
-            article_log = json.load(jsonFile)
-        if content in article_log:
-            return True
-    return False
-
-
-def write_to_logfile(content: dict, filename: str) -> None:
+def dump_metrics() -> None:
     """
-    Append content to json file.
-
-    Args:
-        content: Content to append to file
-        filename: Full path to file that should be appended.
-
-    Returns: None
-
+    Write the metrics snapshot to Settings.metrics_dump_file.
     """
-    try:
-        with open(filename, "w") as fp:
-            json.dump(content, fp, indent=4)
-    except IOError as e:
-        logger.exception(e)
-
-
-def scheduled_job(read_rss_and_tweet, retweet_own, search_and_retweet):
-    schedule = SafeScheduler()
-    # job 1
-    schedule.every().day.at("22:20").do(read_rss_and_tweet)
-    schedule.every().day.at("06:20").do(read_rss_and_tweet)
-    schedule.every().day.at("14:20").do(read_rss_and_tweet)
-    # job 2
-    schedule.every().day.at("01:10").do(retweet_own)
-    schedule.every().day.at("09:10").do(retweet_own)
-    schedule.every().day.at("17:10").do(retweet_own)
-    # job 3
-    schedule.every().day.at("00:20").do(search_and_retweet, "list_search")
-    schedule.every().day.at("03:20").do(search_and_retweet, "list_search")
-    schedule.every().day.at("06:20").do(search_and_retweet, "list_search")
-    schedule.every().day.at("09:20").do(search_and_retweet, "list_search")
-    schedule.every().day.at("12:20").do(search_and_retweet, "list_search")
-    schedule.every().day.at("15:20").do(search_and_retweet, "list_search")
-    schedule.every().day.at("18:20").do(search_and_retweet, "list_search")
-    schedule.every().day.at("21:20").do(search_and_retweet, "list_search")
-
-    schedule.every().day.at("01:25").do(search_and_retweet, "list_search")
-    schedule.every().day.at("04:25").do(search_and_retweet, "list_search")
-    schedule.every().day.at("07:25").do(search_and_retweet, "list_search")
-    schedule.every().day.at("10:25").do(search_and_retweet, "list_search")
-    schedule.every().day.at("13:25").do(search_and_retweet, "list_search")
-    schedule.every().day.at("16:25").do(search_and_retweet, "list_search")
-    schedule.every().day.at("19:25").do(search_and_retweet, "list_search")
-    schedule.every().day.at("22:25").do(search_and_retweet, "list_search")
-    # job love
-    schedule.every(5).minutes.do(search_and_retweet, "give_love")
-
-    while 1:
-        schedule.run_pending()
-        time.sleep(1)
+    metrics.dump(Settings.metrics_dump_file)
+
+
+def scheduled_job(
+    read_rss_and_tweet,
+    retweet_own,
+    search_and_retweet,
+    refresh_feeds,
+    rate_limits=None,
+    profiler=None,
+):
+    global active_scheduler
+    schedule = active_scheduler = SafeScheduler(
+        rate_limits=rate_limits, profiler=profiler
+    )
+    # keep the RSS feed warm between job 1 runs
+    schedule.every(Settings.feed_refresh_minutes).minutes.do(refresh_feeds)
+    # export the stage timings, API calls and caches of the jobs
+    if Settings.metrics_port is not None:
+        try:
+            metrics.serve(Settings.metrics_port)
+        except OSError as e:
+            logger.warning(f"metrics endpoint not started: {e}")
+    schedule.every(Settings.metrics_dump_minutes).minutes.do(dump_metrics)
+    # jobs of the schedule table
+    jobs = {
+        "read_rss_and_tweet": read_rss_and_tweet,
+        "retweet_old_own": retweet_own,
+        "search_and_retweet": search_and_retweet,
+    }
+    for expression, name, args, jitter in Settings.job_schedule:
+        if name not in jobs:
+            raise ValueError(f"unknown job {name} in Settings.job_schedule")
+        schedule.cron(expression, jitter, name).do(jobs[name], *args)
+
+    schedule.run_forever()
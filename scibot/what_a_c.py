@@ -1,16 +1,27 @@
 #!/usr/bin/env python3
-import json
-import os
-import sys
-import re
+import functools
+import heapq
+import math
 import time
+from concurrent.futures import ThreadPoolExecutor
 from os.path import expanduser
 from random import randint
 
 import tweepy
-from bs4 import BeautifulSoup
 from dotenv import load_dotenv
 
+# main was the entry point before the CLI moved to scibot.cli
+from scibot.cli import display_help, main  # noqa: F401
+from scibot.client import twitter_client, StatusResolver
+from scibot.matcher import compile_topic_matcher
+from scibot.metrics import metrics
+from scibot.store import (
+    get_seen_index,
+    get_state_store,
+    get_user_index,
+    FAVED,
+    RETWEETED,
+)
 from scibot.telebot import telegram_bot_sendtext
 from scibot.tools import (
     logger,
@@ -18,8 +29,7 @@ from scibot.tools import (
     insert_hashtag,
     shorten_text,
     compose_message,
-    is_in_logfile,
-    write_to_logfile,
+    defer,
     scheduled_job,
 )
 
@@ -27,102 +37,27 @@ env_path = expanduser("~/.env")
 load_dotenv(dotenv_path=env_path)
 
 
-def main():
-    """
-    Main function of scibot
-
-    """
-
-    logger.info("\n### sciBot started ###\n\n")
-    if len(sys.argv) > 1:
-        try:
-            check_json_exists(
-                Settings.users_json_file,
-                {"test": {"follower": False, "interactions": 0}},
-            )
-            check_json_exists(Settings.faved_tweets_output_file, {"test": {}})
-            check_json_exists(
-                Settings.posted_retweets_output_file,
-                {"test": {}},
-            )
-            check_json_exists(
-                Settings.posted_urls_output_file,
-                {"test": {}},
-            )
-
-            if sys.argv[1].lower() == "rss":
-                read_rss_and_tweet()
-            elif sys.argv[1].lower() == "rtg":
-                search_and_retweet("global_search")
-            elif sys.argv[1].lower() == "glv":
-                search_and_retweet("give_love")
-            elif sys.argv[1].lower() == "rtl":
-                search_and_retweet("list_search")
-            elif sys.argv[1].lower() == "rto":
-                retweet_old_own()
-            elif sys.argv[1].lower() == "sch":
-                scheduled_job(read_rss_and_tweet, retweet_old_own, search_and_retweet)
-
-        except Exception as e:
-            logger.exception(e, exc_info=True)
-            telegram_bot_sendtext(f"[Exception] {e}")
-
-        except IOError as errno:
-            logger.exception(f"[ERROR] {errno}")
-            telegram_bot_sendtext(f"[ERROR] {errno}")
-
-    else:
-        display_help()
-    logger.info("\n\n### sciBot finished ###")
-
-
 # Setup API:
 def twitter_setup():
     """
     Setup Twitter connection for a developer account
-    Returns: tweepy.API object
-
-    """
-    # Authenticate and access using keys:
-    auth = tweepy.OAuthHandler(os.getenv("CONSUMER_KEY"), os.getenv("CONSUMER_SECRET"))
-    auth.set_access_token(os.getenv("ACCESS_TOKEN"), os.getenv("ACCESS_SECRET"))
-
-    # Return API access:
-    api = tweepy.API(auth, wait_on_rate_limit=True, wait_on_rate_limit_notify=True)
-    return api
-
-
-def check_json_exists(file_path: os.path, init_dict: dict) -> None:
-    """
-
-    Create a folder and json file if does not exists
-
-    Args:
-        file_path: Log files file path
-        init_dict: Dictionary to initiate a json file
-
-    Returns: None
+    Returns: shared TwitterClient, proxying a long-lived tweepy.API object
 
     """
-
-    if not os.path.exists(os.path.dirname(os.path.abspath(file_path))):
-        os.makedirs(file_path)
-
-    if not os.path.isfile(file_path):
-        with open(file_path, "w") as json_file:
-            json.dump(init_dict, json_file, indent=4)
+    return twitter_client
 
 
-def get_followers_list() -> list:
+def get_followers_list() -> frozenset:
     """
-    Read json file of followers from Settings.users_json_file
-    Returns: List of followers
+    Read the followers from the user index, reloaded only if another process
+    changed them
+    Returns: Set of followers
 
     """
 
-    with open(Settings.users_json_file, "r") as json_file:
-        users_dic = json.load(json_file)
-    return [x for x in users_dic if users_dic[x]["follower"] is True]
+    users = get_user_index()
+    users.sync()
+    return users.followers()
 
 
 def update_thread(text: str, tweet: tweepy.Status, api: tweepy.API) -> tweepy.Status:
@@ -165,7 +100,7 @@ def post_thread(dict_one_pub: dict, maxlength: int, count: int = 1) -> int:
     for index in range(0, len(text), maxlength):
         if count < 4:
             count += 1
-            time.sleep(2)
+            time.sleep(Settings.thread_reply_delay)
             thread_message = (
                 insert_hashtag(text[index : index + maxlength]) + f"... {count}/5"
             )
@@ -176,7 +111,7 @@ def post_thread(dict_one_pub: dict, maxlength: int, count: int = 1) -> int:
             if count == 4:
                 reply3_tweet = update_thread(thread_message, reply2_tweet, api)
 
-    time.sleep(2)
+    time.sleep(Settings.thread_reply_delay)
     count += 1
     last_msg = shorten_text(dict_one_pub["author-s"][0], 250) + f" {count}/{count}"
 
@@ -184,92 +119,58 @@ def post_thread(dict_one_pub: dict, maxlength: int, count: int = 1) -> int:
 
     return original_tweet.id
 
-def return_doi_str(article):
-    """return doi link if exists"""
-    title_search = re.search('(DOI:<a href=")(.*)(">)', str(article))
-    if title_search:
-        return title_search.group(2)
-    else:
-        return article.link
-
-
+@metrics.timed("make_literature_dict")
 def make_literature_dict(feed: list) -> dict:
     """
-    filter publications from an RSS feed having an abstract, parse html abstract as plane string
+    index the publications of the combined feed by entry id, entries without an
+    abstract were already left out when the feeds were parsed
     Args:
-        feed: list of RSS feed items
+        feed: list of Article
 
     Returns: dictionary of processed publications
 
     """
 
-    dict_publications = {}
-
-    for item in feed:
-        if hasattr(item, "content") and not 'No abstract' in item.description:
-            dict_publications[item.id] = {
-                "title": item.title,
-                "abstract": BeautifulSoup(item.content[0].value, "html.parser")
-                .get_text()
-                .split("ABSTRACT")[1],
-                "link": return_doi_str(item),
-                "description": item.description,
-                "author-s": [
-                    "Authors: " + ", ".join([x["name"] for x in item.authors]),
-                    "Author: " + item.author,
-                ],
-            }
-    return dict_publications
+    return {article.id: article for article in feed}
 
 
 def read_rss_and_tweet() -> None:
     """
 
     Read RSS objects and tweet one calling the post thread function
-    Returns: None, updates log file with the posted article id
+    Returns: None, updates the state store with the posted article id
 
     """
-    dict_publications = make_literature_dict(Settings.combined_feed)
+    # feed parsing is only imported by the commands reading the feeds
+    from scibot.feeds import feed_loader
 
-    with open(Settings.posted_urls_output_file, "r") as jsonFile:
-        article_log = json.load(jsonFile)
+    dict_publications = make_literature_dict(feed_loader.get())
+    state = get_state_store()
 
     for article in sorted(dict_publications.keys(), reverse=True):
 
-        if not is_in_logfile(article, Settings.posted_urls_output_file):
+        if not state.is_posted(article):
             try:
-                article_log[article] = {
-                    "count": 1,
-                    "tweet_id": post_thread(dict_publications[article], 240),
-                }
-
-                write_to_logfile(article_log, Settings.posted_urls_output_file)
+                state.add_publication(
+                    article, post_thread(dict_publications[article], 240)
+                )
                 break
             except tweepy.TweepError as e:
                 logger.error(f"RSS error, possible duplicate {e}, {article}")
-                write_to_logfile(article_log, Settings.posted_urls_output_file)
                 continue
 
 
 def json_add_new_friend(user_id: str) -> None:
     """
-    add user friends to the interactions json file
+    add user friends to the users interactions
     Args:
-        user_id: user id to add to the interactions file
+        user_id: user id to add to the users interactions
 
-    Returns: None, updates interaction file
+    Returns: None, updates the state store
 
     """
 
-    with open(Settings.users_json_file, "r") as json_file:
-        users_dic = json.load(json_file)
-    if user_id not in users_dic:
-        users_dic[user_id] = {"follower": True, "interactions": 1}
-    else:
-        users_dic[user_id]["follower"] = True
-
-    with open(Settings.users_json_file, "w") as json_file:
-        json.dump(users_dic, json_file, indent=4)
+    get_user_index().add_follower(user_id)
 
 
 def post_tweet(message: str) -> None:
@@ -289,6 +190,7 @@ def post_tweet(message: str) -> None:
         logger.error(e)
 
 
+@metrics.timed("filter_repeated_tweets")
 def filter_repeated_tweets(result_search: list, flag: str) -> list:
     """
 
@@ -300,10 +202,7 @@ def filter_repeated_tweets(result_search: list, flag: str) -> list:
 
     """
 
-    if flag == "give_love":
-        out_file = Settings.faved_tweets_output_file
-    else:
-        out_file = Settings.posted_retweets_output_file
+    seen = get_seen_index(FAVED if flag == "give_love" else RETWEETED)
 
     unique_results = {}
 
@@ -313,7 +212,7 @@ def filter_repeated_tweets(result_search: list, flag: str) -> list:
         else:
             check_id = status.id_str
 
-        if not is_in_logfile(check_id, out_file):
+        if check_id not in seen:
             unique_results[status.full_text] = status
 
     return [unique_results[x] for x in unique_results]
@@ -321,22 +220,14 @@ def filter_repeated_tweets(result_search: list, flag: str) -> list:
 
 def json_add_user(user_id: str) -> None:
     """
-    add user to the interactions json file
+    add user to the users interactions
     Args:
         user_id: user id
 
     Returns: None
 
     """
-    with open(Settings.users_json_file, "r") as json_file:
-        users_dic = json.load(json_file)
-    if user_id not in users_dic:
-        users_dic[user_id] = {"follower": False, "interactions": 1}
-    else:
-        users_dic[user_id]["interactions"] += 1
-
-    with open(Settings.users_json_file, "w") as json_file:
-        json.dump(users_dic, json_file, indent=4)
+    get_user_index().add_interaction(user_id)
 
 
 def get_query() -> str:
@@ -367,28 +258,26 @@ def check_interactions(tweet: tweepy.Status) -> None:
         pass  # don't fav your self
 
     auth_id = tweet.author.id_str
-    with open(Settings.users_json_file, "r") as json_file:
-        users_dic = json.load(json_file)
+    users = get_user_index()
 
-        user_list = [
-            users_dic[x]["interactions"]
-            for x in users_dic
-            if users_dic[x]["follower"] == False
-        ]
+    user = users.get(auth_id)
+    if user is None:
+        return False
 
-        down_limit = round(sum(user_list) / len(user_list))
+    down_limit = round(users.mean_non_follower_interactions() or 0)
 
-        if auth_id in users_dic:
-            if users_dic[auth_id]["interactions"] >= down_limit:
-                return True
-            else:
-                return False
-        else:
-            return False
+    if user["interactions"] >= down_limit:
+        return True
+    else:
+        return False
 
 
 def try_retweet(
-    twitter_api: tweepy.API, tweet_text: str, in_tweet_id: str, self_followers: list
+    twitter_api: tweepy.API,
+    tweet_text: str,
+    in_tweet_id: str,
+    self_followers: frozenset,
+    resolver: StatusResolver = None,
 ) -> None:
     """
     try to retweet, if already retweeted try next fom the list
@@ -398,20 +287,25 @@ def try_retweet(
         tweet_text:
         in_tweet_id:
         self_followers:
+        resolver: statuses resolved during the current search cycle
 
     Returns:
 
     """
+    resolver = resolver or StatusResolver(twitter_api)
+
+    tweet_id = find_simple_users(twitter_api, in_tweet_id, self_followers, resolver)
 
-    tweet_id = find_simple_users(twitter_api, in_tweet_id, self_followers)
+    seen = get_seen_index(RETWEETED)
 
-    if not is_in_logfile(in_tweet_id, Settings.posted_retweets_output_file):
+    if in_tweet_id not in seen:
         try:
             twitter_api.retweet(id=tweet_id)
             logger.info(f"Trying to rt {tweet_id}")
-            write_to_logfile({in_tweet_id: {}}, Settings.posted_retweets_output_file)
-            _status = twitter_api.get_status(tweet_id)
-            json_add_user(_status.author.id_str)
+            seen.add(in_tweet_id)
+            _status = resolver.get(tweet_id)
+            if _status is not None:
+                json_add_user(_status.author.id_str)
             if tweet_id == in_tweet_id:
                 id_mess = f"{tweet_id} original"
             else:
@@ -426,9 +320,7 @@ def try_retweet(
             return True
         except tweepy.TweepError as e:
             if e.api_code in Settings.IGNORE_ERRORS:
-                write_to_logfile(
-                    {in_tweet_id: {}}, Settings.posted_retweets_output_file
-                )
+                seen.add(in_tweet_id)
                 logger.exception(e)
                 return False
             else:
@@ -457,8 +349,26 @@ def get_longest_text(status: tweepy.Status) -> str:
         return status.full_text
 
 
+def original_tweet_id(status: tweepy.Status, tweet_id: str) -> str:
+    """
+    Args:
+        status: tweepy.Status object, or None if not found
+        tweet_id: id of the status
+
+    Returns: id of the retweeted tweet for a retweet, else the tweet id itself
+
+    """
+    if hasattr(status, "retweeted_status"):
+        return status.retweeted_status.id_str
+    return tweet_id
+
+
+@metrics.timed("find_simple_users")
 def find_simple_users(
-    twitter_api: tweepy.API, tweet_id: str, followers_list: list
+    twitter_api: tweepy.API,
+    tweet_id: str,
+    followers_list: frozenset,
+    resolver: StatusResolver = None,
 ) -> int:
     """
     retweet/fav from users retweeting something interesting
@@ -466,17 +376,20 @@ def find_simple_users(
         twitter_api:
         tweet_id:
         followers_list:
+        resolver: statuses resolved during the current search cycle
 
     Returns: id of the retweeted/faved tweet
 
     """
+    resolver = resolver or StatusResolver(twitter_api)
+
     # get original retweeter:
-    down_lev_tweet = twitter_api.get_status(tweet_id)
+    down_lev_tweet = resolver.get(tweet_id)
 
-    if hasattr(down_lev_tweet, "retweeted_status"):
-        retweeters = twitter_api.retweets(down_lev_tweet.retweeted_status.id_str)
-    else:
-        retweeters = twitter_api.retweets(tweet_id)
+    retweeters = twitter_api.retweets(
+        original_tweet_id(down_lev_tweet, tweet_id), tweet_mode="extended"
+    )
+    resolver.add(*retweeters)
 
     future_friends = []
     for retweet in retweeters:
@@ -530,21 +443,68 @@ def find_simple_users(
         return tweet_id
 
 
-def filter_tweet(search_results: list, twitter_api):
+def score_candidate(status: tweepy.Status, keyword_matches: list) -> float:
+    """
+    Rank of an on-topic tweet, weighted by Settings.candidate_weights:
+    retweets, favs, keywords matched and the reach (log of the followers)
+    of its author
+    Args:
+        status: candidate tweet
+        keyword_matches: include and watch keywords found in the tweet
+
+    Returns: score, the highest scores are retweeted/faved first
+
+    """
+    weights = Settings.candidate_weights
+    return (
+        weights["retweets"] * status.retweet_count
+        + weights["favorites"] * status.favorite_count
+        + weights["keywords"] * len(keyword_matches)
+        + weights["reach"] * math.log10(1 + status.author.followers_count)
+    )
+
+
+@metrics.timed("filter_tweet")
+def filter_tweet(
+    search_results: list,
+    twitter_api,
+    resolver: StatusResolver = None,
+    top_k: int = None,
+    score=score_candidate,
+):
     """
 
     function to ensure that retweets are on-topic
-    by the hashtag list
+    by the hashtag list, keeping the best ranked tweets only
 
     Args:
         search_results:
         twitter_api:
-        flag:
+        resolver: statuses resolved during the current search cycle
+        top_k: number of candidates kept, Settings.candidate_top_k by default
+        score: function of the status and its keyword matches ranking the candidates
 
-    Returns:
+    Returns: up to top_k (rank, id_str, full_text) tuples, best ranked last
 
     """
-    filtered_search_results = []
+    top_k = top_k or Settings.candidate_top_k
+    filtered_search_results = []  # bounded heap, worst candidate first
+
+    matcher = compile_topic_matcher(
+        tuple(Settings.add_hashtag + Settings.retweet_include_words),
+        tuple(Settings.watch_add_hashtag),
+        tuple(Settings.retweet_exclude_words),
+    )
+
+    resolver = resolver or StatusResolver(twitter_api)
+    resolver.add(*search_results)
+    # resolve every quoted tweet of the cycle at once
+    try:
+        resolver.resolve(
+            [x.quoted_status_id_str for x in search_results if x.is_quote_status]
+        )
+    except tweepy.TweepError as e:
+        telegram_bot_sendtext(f"ERROR {e}, quoted statuses lookup")
 
     for status in search_results:
 
@@ -556,13 +516,12 @@ def filter_tweet(search_results: list, twitter_api):
 
         if status.is_quote_status:
             try:
-                quoted_tweet = twitter_api.get_status(
-                    status.quoted_status_id_str, tweet_mode="extended"
-                )
-
+                quoted_tweet = resolver.get(status.quoted_status_id_str)
             except tweepy.TweepError as e:
                 telegram_bot_sendtext(f"ERROR {e}, {status.quoted_status_id_str}")
-                quoted_tweet = ""
+                continue
+            if quoted_tweet is None:
+                logger.info(f"quoted tweet not found {status.quoted_status_id_str}")
                 continue
 
             end_status = get_longest_text(status) + get_longest_text(quoted_tweet)
@@ -571,32 +530,23 @@ def filter_tweet(search_results: list, twitter_api):
 
         if len(end_status.split()) > 3 and faved_sum[2] > 1:
 
-            joined_list = Settings.add_hashtag + Settings.retweet_include_words
-
-            # remove elements from the exclude words list
-            keyword_matches = [
-                x
-                for x in joined_list + Settings.watch_add_hashtag
-                if x in end_status.lower()
-                and not any(
-                    [
-                        x
-                        for x in Settings.retweet_exclude_words
-                        if x in end_status.lower()
-                    ]
-                )
-            ]
+            # include and watch keywords, none if any exclude word is found
+            keyword_matches = matcher.match(end_status)
 
             if keyword_matches:
 
-                if any(
-                    [x for x in keyword_matches if x not in Settings.watch_add_hashtag]
-                ):
-                    print(keyword_matches, status.full_text)
+                if matcher.is_on_topic(keyword_matches):
+                    logger.debug(f"candidate {keyword_matches}: {status.full_text}")
 
-                    filtered_search_results.append(
-                        (faved_sum, status.id_str, status.full_text)
+                    candidate = (
+                        (score(status, keyword_matches), faved_sum),
+                        status.id_str,
+                        status.full_text,
                     )
+                    if len(filtered_search_results) < top_k:
+                        heapq.heappush(filtered_search_results, candidate)
+                    else:
+                        heapq.heappushpop(filtered_search_results, candidate)
                 else:
                     logger.info(f">> skipped, {keyword_matches}, {end_status}")
 
@@ -604,54 +554,155 @@ def filter_tweet(search_results: list, twitter_api):
     return sorted(filtered_search_results)
 
 
-def try_give_love(twitter_api, in_tweet_id, self_followers):
+def prefetch_candidates(
+    twitter_api, max_val: list, resolver: StatusResolver, flag: str = "global_search"
+) -> None:
     """
-    try to favorite a post from simple users
+    Fetch the retweeters of the best ranked candidates all at once, so the act
+    stage finds them in the client cache instead of fetching them one at a time.
+    Only the first Settings.candidate_prefetch candidates, within the rate limit
+    headroom of the retweets endpoint, are prefetched, the others are fetched
+    on demand if the act stage gets to them
     Args:
         twitter_api:
-        in_tweet_id:
-        self_followers:
+        max_val: ranked candidates, as returned by filter_tweet
+        resolver: statuses resolved during the current search cycle
+        flag: `global_search`, `list_search` or `give_love`
 
-    Returns:
+    Returns: None
 
     """
-    # todo add flag to use sleep or fav immediately
-
-    tweet_id = find_simple_users(twitter_api, in_tweet_id, self_followers)
-
-    if not is_in_logfile(in_tweet_id, Settings.faved_tweets_output_file):
+    tweet_ids = [x[1] for x in reversed(max_val)][: Settings.candidate_prefetch]
+    headroom = twitter_api.rate_limits.headroom("retweets", f"search_and_retweet:{flag}")
+    if headroom is not None:
+        tweet_ids = tweet_ids[:headroom]
+    if not tweet_ids:
+        return
 
+    def fetch(tweet_id):
         try:
-            time.sleep(randint(0, 250))
-            twitter_api.create_favorite(id=tweet_id)
-            write_to_logfile({in_tweet_id: {}}, Settings.faved_tweets_output_file)
-            _status = twitter_api.get_status(tweet_id)
-            json_add_user(_status.author.id_str)
-            message_log = (
-                "faved tweet succesful: https://twitter.com/i/status/{}".format(
-                    tweet_id
-                )
+            return twitter_api.retweets(
+                original_tweet_id(resolver.get(tweet_id), tweet_id),
+                tweet_mode="extended",
             )
-            logger.info(message_log)
-            telegram_bot_sendtext(message_log)
+        except tweepy.TweepError as e:
+            logger.warning(f"retweeters prefetch failed {tweet_id}: {e}")
+            return []
+
+    with ThreadPoolExecutor(
+        max_workers=Settings.candidate_prefetch_workers,
+        thread_name_prefix="scibot-prefetch",
+    ) as pool:
+        for retweeters in pool.map(fetch, tweet_ids):
+            resolver.add(*retweeters)
+
+
+def fav_tweet(twitter_api, in_tweet_id, tweet_id, author_id):
+    """
+    favorite a tweet and save it as faved
+    Args:
+        twitter_api:
+        in_tweet_id: id of the search result the tweet was found from
+        tweet_id: id of the tweet to favorite
+        author_id: id of the author of the tweet, None if unknown
 
+    Returns: False if the tweet can not be faved and the next one should be tried
+
+    """
+    seen = get_seen_index(FAVED)
+
+    try:
+        twitter_api.create_favorite(id=tweet_id)
+        seen.add(in_tweet_id)
+        if author_id is not None:
+            json_add_user(author_id)
+        message_log = "faved tweet succesful: https://twitter.com/i/status/{}".format(
+            tweet_id
+        )
+        logger.info(message_log)
+        telegram_bot_sendtext(message_log)
+
+        return True
+
+    except tweepy.TweepError as e:
+        if e.api_code in Settings.IGNORE_ERRORS:
+            seen.add(in_tweet_id)
+            logger.debug(f"throw a en error {e}")
+            logger.exception(e)
+            return False
+        else:
+            logger.error(e)
             return True
 
-        except tweepy.TweepError as e:
-            if e.api_code in Settings.IGNORE_ERRORS:
-                write_to_logfile({in_tweet_id: {}}, Settings.faved_tweets_output_file)
-                logger.debug(f"throw a en error {e}")
-                logger.exception(e)
-                return False
-            else:
-                logger.error(e)
-                return True
+
+def fav_or_next(twitter_api, in_tweet_id, tweet_id, author_id, next_candidates=None):
+    """
+    favorite a tweet, or move on to the next candidates if it can not be faved
+    Args:
+        twitter_api:
+        in_tweet_id: id of the search result the tweet was found from
+        tweet_id: id of the tweet to favorite
+        author_id: id of the author of the tweet, None if unknown
+        next_candidates: function trying the next candidates, if any
+
+    Returns: True if a tweet was faved
+
+    """
+    if fav_tweet(twitter_api, in_tweet_id, tweet_id, author_id):
+        return True
+    if next_candidates is None:
+        return False
+    logger.info(f"fav of {tweet_id} failed, trying the next candidates")
+    return bool(next_candidates())
+
+
+def try_give_love(
+    twitter_api, in_tweet_id, self_followers, resolver=None, next_candidates=None
+):
+    """
+    try to favorite a post from simple users, after a random delay
+    Args:
+        twitter_api:
+        in_tweet_id:
+        self_followers:
+        resolver: statuses resolved during the current search cycle
+        next_candidates: function trying the next candidates if the fav fails
+
+    Returns: None if already faved, else whether the fav or a next candidate
+        succeeded (True once scheduled under the scheduler)
+
+    """
+    resolver = resolver or StatusResolver(twitter_api)
+
+    tweet_id = find_simple_users(twitter_api, in_tweet_id, self_followers, resolver)
+
+    if in_tweet_id not in get_seen_index(FAVED):
+        _status = resolver.get(tweet_id)
+        author_id = _status.author.id_str if _status is not None else None
+
+        # under the scheduler the fav runs later as a continuation job, which
+        # logs its outcome and moves on to the next candidates itself if it
+        # fails, from the CLI we wait and report its outcome
+        delay = randint(*Settings.fav_delay)
+        faved = defer(
+            delay,
+            fav_or_next,
+            twitter_api,
+            in_tweet_id,
+            tweet_id,
+            author_id,
+            next_candidates,
+        )
+        if faved is None:
+            logger.info(f"fav scheduled in {delay} s: id={tweet_id}")
+            return True
+        return faved
 
     else:
         logger.info("Already faved (id {})".format(tweet_id))
 
 
-def fav_or_tweet(max_val, flag, twitter_api):
+def fav_or_tweet(max_val, flag, twitter_api, resolver=None):
     """
 
     use a tweet or a fav function depending on the flag called
@@ -659,10 +710,12 @@ def fav_or_tweet(max_val, flag, twitter_api):
         max_val:
         flag:
         twitter_api:
+        resolver: statuses resolved during the current search cycle
 
-    Returns:
+    Returns: True if a tweet was retweeted or faved
 
     """
+    resolver = resolver or StatusResolver(twitter_api)
 
     self_followers = get_followers_list()
     count = 0
@@ -674,25 +727,136 @@ def fav_or_tweet(max_val, flag, twitter_api):
         logger.info(f"{len(tweet_text.split())}, {tweet_text}")
 
         if flag == "give_love":
-            use_function = try_give_love(twitter_api, tweet_id, self_followers)
-            log_message = "fav"
+            next_candidates = functools.partial(
+                fav_or_tweet,
+                max_val[: len(max_val) - 1 - count],
+                flag,
+                twitter_api,
+                resolver,
+            )
+            use_function = try_give_love(
+                twitter_api, tweet_id, self_followers, resolver, next_candidates
+            )
+            log_message = None
+            if use_function is False:
+                # the fav failed and the next candidates were tried already
+                return False
 
         else:
             use_function = try_retweet(
-                twitter_api, tweet_text, tweet_id, self_followers
+                twitter_api, tweet_text, tweet_id, self_followers, resolver
             )
             log_message = "retweet"
 
         if use_function:
-            logger.info(f"{log_message}ed: id={tweet_id} text={tweet_text}")
-            break
+            # a fav logs its own outcome, under the scheduler it is only
+            # scheduled yet
+            if log_message is not None:
+                logger.info(f"{log_message}ed: id={tweet_id} text={tweet_text}")
+            return True
         else:
             count += 1
-            time.sleep(2)
             if count >= len(max_val):
                 logger.debug("no more tweets to post")
             continue
 
+    return False
+
+
+def poll_new_statuses(fetch, source: str, count: int, max_pages: int = None) -> tuple:
+    """
+    Fetch the statuses of a timeline or search posted since its last poll.
+
+    Args:
+        fetch: tweepy API method accepting count, since_id and max_id
+        source: name of the cursor persisted for this timeline or search
+        count: Number of tweets per page
+        max_pages: most pages fetched, Settings.poll_max_pages by default
+
+    Returns: list of new statuses and the newest status id seen
+
+    """
+    max_pages = max_pages or Settings.poll_max_pages
+    since_id = get_state_store().get_cursor(source)
+    statuses = page = fetch(count=count, since_id=since_id, tweet_mode="extended")
+
+    if since_id is not None:
+        # page back while full pages suggest more tweets since the last poll
+        pages = 1
+        while len(page) >= count and pages < max_pages:
+            page = fetch(
+                count=count,
+                since_id=since_id,
+                max_id=min(x.id for x in page) - 1,
+                tweet_mode="extended",
+            )
+            statuses = statuses + page
+            pages += 1
+
+    newest_id = max([x.id for x in statuses], default=since_id)
+    return statuses, newest_id
+
+
+def search_sources(twitter_api, flag: str) -> dict:
+    """
+    Timelines and searches polled by a search_and_retweet flag.
+
+    Args:
+        twitter_api:
+        flag: `global_search`, `list_search` or `give_love`
+
+    Returns: dictionary of cursor name -> fetch function
+
+    """
+
+    def search_global(**kwargs):
+        return twitter_api.search(q=get_query(), **kwargs)
+
+    def search_list(**kwargs):
+        return twitter_api.list_timeline(list_id=Settings.mylist_id, **kwargs)
+
+    # each flag keeps its own cursors, so frequent jobs do not hide new
+    # tweets from the less frequent ones
+    if flag == "global_search":
+        # search results retweets globally forgiven keywords
+        sources = {f"{flag}:search": search_global}  # standard search results
+    elif flag == "list_search":
+        # search list retwwets most commented ad rt from the experts lists
+        sources = {f"{flag}:list": search_list}  # list to tweet from
+    else:
+        sources = {f"{flag}:list": search_list, f"{flag}:search": search_global}
+    return sources
+
+
+def save_cursors(cursors: dict) -> None:
+    """
+    Persist the newest status id seen per source, once a cycle is done.
+    """
+    state = get_state_store()
+    for source, since_id in cursors.items():
+        if since_id is not None:
+            state.set_cursor(source, since_id)
+
+
+def poll_pages(twitter_api, flag: str, source: str) -> int:
+    """
+    Pages a poll may fetch without eating into the rate limit reserve kept
+    for higher priority jobs.
+
+    Args:
+        twitter_api:
+        flag: `global_search`, `list_search` or `give_love`
+        source: cursor name of the timeline or search, as in search_sources
+
+    Returns: number of pages, at least one
+
+    """
+    method = "search" if source.endswith(":search") else "list_timeline"
+    headroom = twitter_api.rate_limits.headroom(method, f"search_and_retweet:{flag}")
+    if headroom is None:
+        return Settings.poll_max_pages
+    return max(min(Settings.poll_max_pages, headroom), 1)
+
 
 def search_and_retweet(flag: str = "global_search", count: int = 100):
     """
@@ -708,33 +872,36 @@ def search_and_retweet(flag: str = "global_search", count: int = 100):
 
     """
 
-    try:
-        twitter_api = twitter_setup()
-        if flag == "global_search":
-            # search results retweets globally forgiven keywords
-            search_results = twitter_api.search(
-                q=get_query(), count=count, tweet_mode="extended"
-            )  # standard search results
-        elif flag == "list_search":
-            # search list retwwets most commented ad rt from the experts lists
-            search_results = twitter_api.list_timeline(
-                list_id=Settings.mylist_id, count=count, tweet_mode="extended"
-            )  # list to tweet from
+    twitter_api = twitter_setup()
+    sources = search_sources(twitter_api, flag)
 
-        else:
-            search_results = twitter_api.list_timeline(
-                list_id=Settings.mylist_id, count=count, tweet_mode="extended"
-            ) + twitter_api.search(q=get_query(), count=count, tweet_mode="extended")
+    search_results = []
+    cursors = {}
+    try:
+        for source, fetch in sources.items():
+            statuses, cursors[source] = poll_new_statuses(
+                fetch, source, count, poll_pages(twitter_api, flag, source)
+            )
+            search_results += statuses
 
     except tweepy.TweepError as e:
         logger.exception(e.reason)
         telegram_bot_sendtext(f"ERROR : {e.reason}")
         return
 
-    # get the most faved + rtweeted and retweet it
-    max_val = filter_tweet(filter_repeated_tweets(search_results, flag), twitter_api)
+    resolver = StatusResolver(twitter_api)
+
+    # get the best ranked tweets and retweet the first one that works
+    max_val = filter_tweet(
+        filter_repeated_tweets(search_results, flag), twitter_api, resolver
+    )
+    prefetch_candidates(twitter_api, max_val, resolver, flag)
+
+    fav_or_tweet(max_val, flag, twitter_api, resolver)
+    logger.debug(f"twitter cache stats: {twitter_api.cache_stats()}")
+    logger.debug(f"twitter rate limits: {twitter_api.rate_limits.stats()}")
 
-    fav_or_tweet(max_val, flag, twitter_api)
+    save_cursors(cursors)
 
 
 def retweet(tweet: tweepy.Status):
@@ -774,46 +941,45 @@ def retweet_old_own():
     """
 
     twitter_api = twitter_setup()
+    state = get_state_store()
 
-    with open(Settings.posted_urls_output_file, "r") as jsonFile:
-        article_log = json.load(jsonFile)
-
-    article_log_reversed = {article_log[x]['tweet_id']:{**article_log[x], **{'id':x}} for x in article_log}
-
+    candidates = state.least_retweeted_publications()
+    resolver = StatusResolver(twitter_api, tweet_mode=None)
 
-    min_val = min(article_log[x]["count"] for x in article_log)
-
-    for art in sorted(list(article_log_reversed), key=None, reverse=False):
-        tweet = twitter_api.statuses_lookup([article_log_reversed[art]["tweet_id"]])
-        if tweet and article_log_reversed[art]["count"] <= min_val:
-            retweet(tweet[0])
-            article_log[article_log_reversed[art]['id']]["count"] += 1
+    for index, (article_id, tweet_id, count) in enumerate(candidates):
+        if index % resolver.lookup_size == 0:
+            # look up the next 100 candidates in one call
+            resolver.resolve(
+                [x[1] for x in candidates[index : index + resolver.lookup_size]]
+            )
+        tweet = resolver.get(tweet_id)
+        if tweet:
+            retweet(tweet)
+            state.increment_publication_count(article_id)
 
             break
 
-    with open(Settings.posted_urls_output_file, "w") as fp:
-        json.dump(article_log, fp, indent=4)
-
 
-def display_help():
+def run_scheduled_jobs(search=search_and_retweet, profiler=None) -> None:
     """
-    Show available commands.
+    Run the scheduled jobs forever, with the background feed refresh.
 
-    Returns: Prints available commands
+    Args:
+        search: search_and_retweet, or its async version
+        profiler: Profiler profiling every job run, if any
 
     """
+    from scibot.feeds import feed_loader
 
-    print("Syntax: python {} [command]".format(sys.argv[0]))
-    print()
-    print(" Commands:")
-    print("    rss    Read URL and post new items to Twitter")
-    print("    rtg    Search and retweet keywords from global feed")
-    print("    rtl    Search and retweet keywords from list feed")
-    print("    glv    Fav tweets from list or globally")
-    print("    rto    Retweet last own tweet")
-    print("    sch    Run scheduled jobs on infinite loop")
-    print("    help   Show this help screen")
-
+    feed_loader.refresh_async()
+    scheduled_job(
+        read_rss_and_tweet,
+        retweet_old_own,
+        search,
+        feed_loader.refresh_async,
+        rate_limits=twitter_client.rate_limits,
+        profiler=profiler,
+    )
 
 if __name__ == "__main__":
     main()
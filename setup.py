@@ -18,7 +18,7 @@ setup(
     ],
     entry_points={
         "console_scripts": [
-            "scibot=scibot.what_a_c:main",
+            "scibot=scibot.cli:main",
         ]
     },
     install_requires=[